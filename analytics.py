@@ -0,0 +1,189 @@
+# analytics.py
+"""Statistiques quotidiennes par video et par createur (tableau de bord).
+
+Les routes enregistrent des increments en memoire (vue, like, dislike,
+xp, commentaire, nouvel abonne) ; une tache de fond les ajoute par lots
+aux tables video_daily_stats et creator_daily_stats (upsert additif).
+/api/creators/<id>/stats ne lit que ces agregats, jamais les tables
+brutes. Les increments sont nets : retirer un like le jour J decremente
+les likes du jour J.
+
+`flask backfill-stats` reconstruit likes, dislikes, xp, commentaires et
+abonnes depuis les tables brutes (par date de creation). Les vues n'ont
+pas d'historique brut : elles ne sont jamais ecrasees par le backfill.
+"""
+import threading
+from datetime import date, datetime, time as dtime, timedelta
+
+from extensions import db, dialect_insert
+
+VIDEO_FIELDS = ("views", "likes", "dislikes", "xp", "comments")
+CREATOR_FIELDS = VIDEO_FIELDS + ("new_followers",)
+BACKFILL_FIELDS = ("likes", "dislikes", "xp", "comments", "new_followers")
+
+FLUSH_INTERVAL = 10           # secondes
+UPSERT_CHUNK = 500
+TOP_VIDEOS = 5
+
+
+def _as_date(value) -> date:
+    """func.date() renvoie une date (Postgres) ou une chaine (SQLite)."""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _add(target: dict, key, field: str, delta: int):
+    counts = target.setdefault(key, {})
+    counts[field] = counts.get(field, 0) + delta
+
+
+class StatsRollup:
+    def __init__(self):
+        self._videos = {}             # (video_id, jour) -> {champ: increment}
+        self._creators = {}           # (user_id, jour) -> {champ: increment}
+        self._lock = threading.Lock()
+
+    # -- ecriture -------------------------------------------------------
+    def record(self, video_id: int, creator_id, field: str, delta: int = 1):
+        """Increment d'un compteur pour la video et son createur (sans SQL)."""
+        day = datetime.utcnow().date()
+        with self._lock:
+            _add(self._videos, (video_id, day), field, delta)
+            if creator_id:
+                _add(self._creators, (creator_id, day), field, delta)
+
+    def record_follower(self, creator_id: int, delta: int = 1):
+        with self._lock:
+            _add(self._creators, (creator_id, datetime.utcnow().date()), "new_followers", delta)
+
+    def _upsert(self, model, key_name: str, fields, pending: dict):
+        table = model.__table__
+        rows = [
+            {key_name: owner_id, "day": day, **{f: counts.get(f, 0) for f in fields}}
+            for (owner_id, day), counts in pending.items()
+        ]
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            stmt = dialect_insert(table).values(rows[i:i + UPSERT_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c[key_name], table.c.day],
+                set_={f: table.c[f] + stmt.excluded[f] for f in fields},
+            )
+            db.session.execute(stmt)
+
+    def flush(self):
+        from models import CreatorDailyStats, Video, VideoDailyStats
+        with self._lock:
+            videos, self._videos = self._videos, {}
+            creators, self._creators = self._creators, {}
+        if not videos and not creators:
+            return 0
+        try:
+            # Videos supprimees entre-temps : leurs increments sont ignores
+            existing = {
+                video_id for (video_id,) in db.session.query(Video.id)
+                .filter(Video.id.in_({video_id for video_id, _ in videos}))
+            } if videos else set()
+            videos = {key: counts for key, counts in videos.items() if key[0] in existing}
+            if videos:
+                self._upsert(VideoDailyStats, "video_id", VIDEO_FIELDS, videos)
+            if creators:
+                self._upsert(CreatorDailyStats, "user_id", CREATOR_FIELDS, creators)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erreur flush statistiques: {e}")
+            with self._lock:
+                for target, pending in ((self._videos, videos), (self._creators, creators)):
+                    for key, counts in pending.items():
+                        for field, delta in counts.items():
+                            _add(target, key, field, delta)
+            return 0
+        return len(videos) + len(creators)
+
+    # -- reconstruction -------------------------------------------------
+    def backfill(self, days: int = None) -> dict:
+        """Recalcule les compteurs (hors vues) depuis likes, xp, comments et follows."""
+        from models import Comment, CreatorDailyStats, Follow, Like, Video, VideoDailyStats, Xp
+        since = datetime.utcnow().date() - timedelta(days=days - 1) if days else None
+
+        def grouped(owner_col, created_col, *extra):
+            day = db.func.date(created_col)
+            query = db.session.query(owner_col, day, *extra, db.func.count())
+            if since:
+                query = query.filter(created_col >= datetime.combine(since, dtime()))
+            return query.group_by(owner_col, day, *extra)
+
+        per_video = {}
+        for video_id, day, is_like, n in grouped(Like.video_id, Like.created_at, Like.is_like):
+            _add(per_video, (video_id, _as_date(day)), "likes" if is_like else "dislikes", n)
+        for video_id, day, n in grouped(Xp.video_id, Xp.created_at):
+            _add(per_video, (video_id, _as_date(day)), "xp", n)
+        for video_id, day, n in grouped(Comment.video_id, Comment.created_at):
+            _add(per_video, (video_id, _as_date(day)), "comments", n)
+
+        per_creator = {}
+        owners = dict(
+            db.session.query(Video.id, Video.user_id).filter(Video.user_id.isnot(None))
+        )
+        for (video_id, day), counts in per_video.items():
+            if video_id in owners:
+                for field, n in counts.items():
+                    _add(per_creator, (owners[video_id], day), field, n)
+        for user_id, day, n in grouped(Follow.followed_id, Follow.created_at):
+            _add(per_creator, (user_id, _as_date(day)), "new_followers", n)
+
+        # Remise a zero de la periode, puis upsert additif (les vues sont conservees)
+        for model, fields in ((VideoDailyStats, VIDEO_FIELDS), (CreatorDailyStats, CREATOR_FIELDS)):
+            reset = model.query
+            if since:
+                reset = reset.filter(model.day >= since)
+            reset.update({f: 0 for f in fields if f in BACKFILL_FIELDS}, synchronize_session=False)
+        if per_video:
+            self._upsert(VideoDailyStats, "video_id", VIDEO_FIELDS, per_video)
+        if per_creator:
+            self._upsert(CreatorDailyStats, "user_id", CREATOR_FIELDS, per_creator)
+        db.session.commit()
+        return {"video_days": len(per_video), "creator_days": len(per_creator)}
+
+    # -- lecture ----------------------------------------------------------
+    def creator_stats(self, user_id: int, days: int = 30) -> dict:
+        from models import CreatorDailyStats, Video, VideoDailyStats
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        daily = (
+            CreatorDailyStats.query
+            .filter(CreatorDailyStats.user_id == user_id, CreatorDailyStats.day >= since)
+            .order_by(CreatorDailyStats.day)
+            .all()
+        )
+        lifetime = db.session.query(
+            *[db.func.coalesce(db.func.sum(getattr(CreatorDailyStats, f)), 0) for f in CREATOR_FIELDS]
+        ).filter(CreatorDailyStats.user_id == user_id).one()
+
+        views = db.func.sum(VideoDailyStats.views)
+        top = (
+            db.session.query(Video.id, Video.title, views, db.func.sum(VideoDailyStats.likes))
+            .join(VideoDailyStats, VideoDailyStats.video_id == Video.id)
+            .filter(Video.user_id == user_id, VideoDailyStats.day >= since)
+            .group_by(Video.id, Video.title)
+            .order_by(views.desc())
+            .limit(TOP_VIDEOS)
+        )
+        return {
+            "creator_id": user_id,
+            "days": days,
+            "totals": {f: sum(getattr(row, f) for row in daily) for f in CREATOR_FIELDS},
+            "lifetime": dict(zip(CREATOR_FIELDS, (int(x) for x in lifetime))),
+            "daily": [
+                {"day": row.day.isoformat(), **{f: getattr(row, f) for f in CREATOR_FIELDS}}
+                for row in daily
+            ],
+            "top_videos": [
+                {"id": video_id, "title": title, "views": int(v or 0), "likes": int(l or 0)}
+                for video_id, title, v, l in top
+            ],
+        }
+
+    def register(self, runner):
+        runner.every(FLUSH_INTERVAL, self.flush, "statistiques: flush")
+
+
+stats = StatsRollup()
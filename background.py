@@ -0,0 +1,71 @@
+# background.py
+"""Taches de fond par worker : un seul thread execute les taches periodiques
+(tendances, suggestions...) et les travaux ponctuels soumis par les routes,
+chacun dans un contexte d'application avec sa propre session."""
+import queue
+import threading
+import time
+
+from extensions import db
+
+TICK = 1.0
+# File bornee : au-dela, submit() refuse (quelques minutes de travaux de fond)
+MAX_JOBS = 1_000
+
+
+class BackgroundRunner:
+    def __init__(self):
+        self._periodic = []          # [intervalle, fonction, nom, derniere execution]
+        self._jobs = queue.Queue(maxsize=MAX_JOBS)
+        self._thread = None
+
+    def every(self, seconds: float, fn, name: str = None):
+        self._periodic.append([seconds, fn, name or fn.__name__, 0.0])
+
+    def submit(self, fn, *args) -> bool:
+        """Met un travail en file ; False si la file est pleine (travail abandonne)."""
+        try:
+            self._jobs.put_nowait((fn, args))
+            return True
+        except queue.Full:
+            print(f"⚠ File de fond pleine, travail ignore: {fn.__name__}")
+            return False
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,), name="background", daemon=True)
+        self._thread.start()
+
+    def _call(self, app, fn, args, name):
+        with app.app_context():
+            try:
+                fn(*args)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erreur tache de fond {name}: {e}")
+            finally:
+                db.session.remove()
+
+    def _run(self, app):
+        while True:
+            now = time.time()
+            for task in self._periodic:
+                interval, fn, name, last = task
+                if now - last >= interval:
+                    task[3] = now
+                    self._call(app, fn, (), name)
+            # Travaux ponctuels jusqu'au prochain tick
+            deadline = time.time() + TICK
+            while True:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    fn, args = self._jobs.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                self._call(app, fn, args, fn.__name__)
+
+
+runner = BackgroundRunner()
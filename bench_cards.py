@@ -0,0 +1,93 @@
+# bench_cards.py
+"""Benchmark des listes de videos : entites ORM completes vs cartes VideoCard.
+
+Base SQLite en memoire, descriptions longues comme en production ; mesure
+le temps de chargement + lecture des champs affiches et le pic memoire
+(tracemalloc) pour une page d'accueil (40 lignes) et un gros lot (1000).
+
+    python bench_cards.py --rows 40 1000 --repeat 50
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from extensions import db
+
+GRID_FIELDS = ("id", "title", "creator", "views", "thumb_url", "thumb_srcset", "created_at")
+
+
+def make_app(n_videos: int):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    from models import Video
+    with app.app_context():
+        db.create_all()
+        start = datetime(2025, 1, 1)
+        db.session.execute(Video.__table__.insert(), [
+            {
+                "title": f"Video {i}", "description": "lorem ipsum " * 200,
+                "category": "tendance", "creator": f"createur{i % 97}", "views": i,
+                "thumb_url": f"https://cdn.example/t/{i}.jpg",
+                "thumb_srcset": f"https://cdn.example/t/{i}-320.webp 320w, https://cdn.example/t/{i}-640.webp 640w",
+                "external_url": f"https://cdn.example/v/{i}.mp4",
+                "created_at": start + timedelta(minutes=i),
+            }
+            for i in range(n_videos)
+        ])
+        db.session.commit()
+    return app
+
+
+def load_orm(limit: int):
+    from models import Video
+    return Video.query.order_by(Video.created_at.desc()).limit(limit).all()
+
+
+def load_card_rows(limit: int):
+    from models import Video, card_select, load_cards
+    return load_cards(card_select().order_by(Video.created_at.desc()).limit(limit))
+
+
+def measure(loader, limit: int, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        items = loader(limit)
+        for item in items:
+            for field in GRID_FIELDS:
+                getattr(item, field)
+        timings.append(time.perf_counter() - t0)
+        db.session.remove()
+
+    tracemalloc.start()
+    items = loader(limit)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del items
+    db.session.remove()
+    timings.sort()
+    return timings[len(timings) // 2], peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[40, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    app = make_app(max(args.rows))
+    with app.app_context():
+        for limit in args.rows:
+            orm_time, orm_peak = measure(load_orm, limit, args.repeat)
+            card_time, card_peak = measure(load_card_rows, limit, args.repeat)
+            print(f"{limit:>5} lignes  ORM   {orm_time * 1000:8.2f} ms  {orm_peak / 1024:8.0f} Kio")
+            print(f"{'':>5}         cartes{card_time * 1000:8.2f} ms  {card_peak / 1024:8.0f} Kio"
+                  f"  (x{orm_time / card_time:.1f} plus rapide, x{orm_peak / card_peak:.1f} moins de memoire)")
+
+
+if __name__ == "__main__":
+    main()
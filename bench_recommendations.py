@@ -0,0 +1,60 @@
+# bench_recommendations.py
+"""Benchmark du calcul des co-likes sur donnees synthetiques (sans base).
+
+Popularite des videos et activite des utilisateurs suivent des lois de
+puissance, comme sur le site : quelques videos concentrent les likes.
+
+    python bench_recommendations.py --interactions 5000000 --videos 50000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from recommendations import build_matrix, iter_neighbours, TOP_N, BLOCK_SIZE
+
+
+def synthetic(n_interactions: int, n_users: int, n_videos: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    video_p = 1.0 / np.arange(1, n_videos + 1) ** 0.9
+    user_p = 1.0 / np.arange(1, n_users + 1) ** 0.7
+    videos = rng.choice(n_videos, size=n_interactions, p=video_p / video_p.sum())
+    users = rng.choice(n_users, size=n_interactions, p=user_p / user_p.sum())
+    # Une seule interaction par (utilisateur, video), comme les contraintes uniques
+    pairs = np.unique(users.astype(np.int64) * n_videos + videos)
+    users, videos = pairs // n_videos, pairs % n_videos
+    weights = np.where(rng.random(len(pairs)) < 0.2, 2.0, 1.0).astype(np.float32)
+    return users, videos, weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interactions", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--videos", type=int, default=20_000)
+    parser.add_argument("--top-n", type=int, default=TOP_N)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    users, videos, weights = synthetic(args.interactions, args.users, args.videos)
+    t1 = time.perf_counter()
+    X, video_ids = build_matrix(users, videos, weights)
+    t2 = time.perf_counter()
+
+    lists = pairs = 0
+    for block in iter_neighbours(X, args.top_n, args.block_size):
+        lists += len(block)
+        pairs += sum(len(cols) for _, cols, _ in block)
+    t3 = time.perf_counter()
+
+    print(f"Interactions uniques : {len(users):,}")
+    print(f"Matrice              : {X.shape[0]:,} x {X.shape[1]:,}, nnz={X.nnz:,}")
+    print(f"Generation           : {t1 - t0:.2f}s")
+    print(f"Construction matrice : {t2 - t1:.2f}s")
+    print(f"Top-{args.top_n} voisins       : {t3 - t2:.2f}s "
+          f"({lists:,} listes, {pairs:,} paires, {lists / max(t3 - t2, 1e-9):,.0f} videos/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,12 @@ from flask_migrate import Migrate
 
 db = SQLAlchemy()
 migrate = Migrate()
+
+
+def dialect_insert(table):
+    """INSERT ... ON CONFLICT du dialecte courant (Postgres en prod, SQLite en local)."""
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
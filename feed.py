@@ -0,0 +1,150 @@
+# feed.py
+"""Fil d'abonnements : timelines materialisees par utilisateur.
+
+Fan-out a l'ecriture : a l'upload, une tache de fond ajoute la video dans
+la timeline de chaque abonne du createur. Pour les tres gros createurs
+(plus de FANOUT_MAX_FOLLOWERS abonnes) on ne fait pas de fan-out : leurs
+videos sont lues directement a la lecture du fil et fusionnees avec la
+timeline. La pagination se fait par curseur (created_at, video_id), sans
+OFFSET.
+"""
+import os
+from datetime import datetime
+
+from extensions import db
+
+FANOUT_MAX_FOLLOWERS = int(os.getenv("FEED_FANOUT_MAX_FOLLOWERS", "10000"))
+FANOUT_BATCH = 1000
+BACKFILL_VIDEOS = 50          # videos ajoutees au fil lors d'un nouvel abonnement
+PAGE_SIZE = 24
+
+
+def encode_cursor(created_at: datetime, video_id: int) -> str:
+    return f"{created_at.isoformat()}_{video_id}"
+
+
+def decode_cursor(cursor: str):
+    """Retourne (created_at, video_id), ou None si le curseur est absent/invalide."""
+    try:
+        stamp, video_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(stamp), int(video_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def followers_count(user_id: int) -> int:
+    from models import User
+    return db.session.query(User.followers_count).filter(User.id == user_id).scalar() or 0
+
+
+def large_creators(creator_ids) -> set:
+    """Createurs (parmi `creator_ids`) servis en fan-out a la lecture."""
+    from models import User
+    if not creator_ids:
+        return set()
+    rows = db.session.query(User.id).filter(
+        User.id.in_(creator_ids), User.followers_count > FANOUT_MAX_FOLLOWERS
+    )
+    return {creator_id for (creator_id,) in rows}
+
+
+# -- ecriture (taches de fond) -----------------------------------------------
+def fanout(video_id: int) -> int:
+    """Ajoute la video au fil de chaque abonne de son createur."""
+    from models import Follow, TimelineEntry, Video
+    video = db.session.get(Video, video_id)
+    if video is None or not video.user_id:
+        return 0
+    if followers_count(video.user_id) > FANOUT_MAX_FOLLOWERS:
+        return 0
+
+    # Idempotent : une tache rejouee ne cree pas de doublon
+    TimelineEntry.query.filter_by(video_id=video.id).delete(synchronize_session=False)
+    follower_ids = (
+        db.session.query(Follow.follower_id)
+        .filter(Follow.followed_id == video.user_id)
+        .execution_options(yield_per=FANOUT_BATCH)
+    )
+    created_at = video.created_at or datetime.utcnow()
+    total = 0
+    batch = []
+    for (follower_id,) in follower_ids:
+        batch.append({"user_id": follower_id, "video_id": video.id, "created_at": created_at})
+        if len(batch) >= FANOUT_BATCH:
+            db.session.execute(TimelineEntry.__table__.insert(), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(TimelineEntry.__table__.insert(), batch)
+        total += len(batch)
+    db.session.commit()
+    return total
+
+
+def backfill(follower_id: int, creator_id: int) -> int:
+    """Nouvel abonnement : copie les dernieres videos du createur dans le fil."""
+    from models import TimelineEntry, Video
+    if followers_count(creator_id) > FANOUT_MAX_FOLLOWERS:
+        return 0
+    present = db.session.query(TimelineEntry.video_id).filter(TimelineEntry.user_id == follower_id)
+    rows = [
+        {"user_id": follower_id, "video_id": video_id, "created_at": created_at}
+        for video_id, created_at in (
+            db.session.query(Video.id, Video.created_at)
+            .filter(Video.user_id == creator_id, Video.created_at.isnot(None), Video.id.notin_(present))
+            .order_by(Video.created_at.desc())
+            .limit(BACKFILL_VIDEOS)
+        )
+    ]
+    if rows:
+        db.session.execute(TimelineEntry.__table__.insert(), rows)
+        db.session.commit()
+    return len(rows)
+
+
+def remove_creator(follower_id: int, creator_id: int) -> int:
+    """Desabonnement : retire les videos du createur du fil."""
+    from models import TimelineEntry, Video
+    videos = db.session.query(Video.id).filter(Video.user_id == creator_id)
+    deleted = TimelineEntry.query.filter(
+        TimelineEntry.user_id == follower_id, TimelineEntry.video_id.in_(videos)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+# -- lecture -------------------------------------------------------------------
+def page(user_id: int, cursor: str = None, limit: int = PAGE_SIZE):
+    """Retourne (cartes video, curseur suivant ou None), du plus recent au plus ancien."""
+    from models import Follow, TimelineEntry, Video, cards_by_ids
+    after = decode_cursor(cursor) if cursor else None
+
+    timeline = db.session.query(TimelineEntry.created_at, TimelineEntry.video_id).filter(
+        TimelineEntry.user_id == user_id
+    )
+    if after:
+        timeline = timeline.filter(db.tuple_(TimelineEntry.created_at, TimelineEntry.video_id) < after)
+    candidates = list(
+        timeline.order_by(TimelineEntry.created_at.desc(), TimelineEntry.video_id.desc()).limit(limit)
+    )
+
+    # Fan-out a la lecture pour les gros createurs suivis
+    followed = [
+        followed_id for (followed_id,) in
+        db.session.query(Follow.followed_id).filter(Follow.follower_id == user_id)
+    ]
+    large = large_creators(followed)
+    if large:
+        direct = db.session.query(Video.created_at, Video.id).filter(
+            Video.user_id.in_(large), Video.created_at.isnot(None)
+        )
+        if after:
+            direct = direct.filter(db.tuple_(Video.created_at, Video.id) < after)
+        candidates += list(direct.order_by(Video.created_at.desc(), Video.id.desc()).limit(limit))
+
+    # Fusion : un createur passe au-dessus du seuil a deja des videos en timeline
+    merged = sorted(set((created_at, video_id) for created_at, video_id in candidates), reverse=True)[:limit]
+    ids = [video_id for _, video_id in merged]
+    videos = cards_by_ids(ids)
+    next_cursor = encode_cursor(*merged[-1]) if len(merged) == limit else None
+    return videos, next_cursor
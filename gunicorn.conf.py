@@ -0,0 +1,16 @@
+# gunicorn.conf.py
+"""Configuration gunicorn (lue automatiquement depuis le dossier courant).
+
+Les taches de fond ne demarrent pas a l'import de home : chaque worker les
+lance une fois l'application chargee.
+"""
+import os
+
+# L'upload est synchrone (envoi Supabase, miniatures, transcodage HLS) : les
+# 30 s par defaut tueraient le worker au milieu d'un transcodage
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+
+
+def post_worker_init(worker):
+    from home import start_background
+    start_background()
@@ -0,0 +1,231 @@
+# heartbeats.py
+"""Battements de lecture (heartbeats) et temps de visionnage par heure.
+
+Le lecteur envoie un battement toutes les ~15 s de lecture. La route ne
+fait aucun SQL : le battement est ajoute a un tampon circulaire borne.
+Une tache de fond vide le tampon, agrege par (video, heure) et ecrit le
+tout dans watch_time_hourly en un upsert par lot.
+
+Perte bornee : au plus le contenu du tampon d'un worker (quelques
+secondes) en cas d'arret brutal. Contre-pression : tampon plein -> la
+route repond 429 avec Retry-After, le lecteur garde son temps accumule et
+le renvoie plus tard. Meme reponse quand un client depasse son debit
+(seau a jetons par utilisateur ou par adresse IP, cf. RateLimiter).
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+
+from extensions import db, dialect_insert
+from probe import MAX_DURATION
+
+CAPACITY = 50_000
+FLUSH_INTERVAL = 5            # secondes
+UPSERT_CHUNK = 500
+RETRY_AFTER = 30              # secondes suggerees au client quand le tampon est plein
+# Un lecteur envoie 1 battement / 15 s : marge pour ~15 lecteurs derriere une meme IP
+CLIENT_RATE = 1.0             # battements par seconde et par client
+CLIENT_BURST = 20
+MAX_CLIENTS = 100_000
+
+
+class RingBuffer:
+    """Tampon circulaire de taille fixe ; push refuse (False) quand il est plein."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._head = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def push(self, item) -> bool:
+        with self._lock:
+            if self._size == self.capacity:
+                return False
+            self._items[(self._head + self._size) % self.capacity] = item
+            self._size += 1
+            return True
+
+    def drain(self) -> list:
+        with self._lock:
+            capacity = self.capacity
+            out = [self._items[(self._head + i) % capacity] for i in range(self._size)]
+            for i in range(self._size):
+                self._items[(self._head + i) % capacity] = None
+            self._head = (self._head + self._size) % capacity
+            self._size = 0
+            return out
+
+
+class RateLimiter:
+    """Seau a jetons par client, propre au worker ; les clients les moins
+    recemment vus sont oublies au-dela de `max_clients`."""
+
+    def __init__(self, rate: float = CLIENT_RATE, burst: int = CLIENT_BURST,
+                 max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()     # client -> (jetons, instant)
+        self._lock = threading.Lock()
+
+    def allow(self, client: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[client] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+class HeartbeatIngestor:
+    def __init__(self, capacity: int = CAPACITY):
+        self.buffer = RingBuffer(capacity)
+        self.limiter = RateLimiter()
+        self._carry = {}              # agregats d'un flush echoue, retentes au suivant
+        self.accepted = 0
+        self.rejected = 0
+        self.limited = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def ingest(self, video_id: int, elapsed: float, started: bool = False,
+               completed: bool = False, client: str = None) -> bool:
+        """Ajoute un battement ; False si le tampon est plein (contre-pression)
+        ou si `client` depasse son debit. ValueError si `elapsed` n'est pas fini."""
+        elapsed = float(elapsed or 0)
+        if not math.isfinite(elapsed):
+            raise ValueError(f"Duree invalide: {elapsed}")
+        elapsed = min(max(elapsed, 0.0), float(MAX_DURATION))
+        if client is not None and not self.limiter.allow(client):
+            self.limited += 1
+            return False
+        hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        if self.buffer.push((video_id, hour, elapsed, bool(started), bool(completed))):
+            self.accepted += 1
+            return True
+        self.rejected += 1
+        return False
+
+    @staticmethod
+    def aggregate(events, into: dict = None) -> dict:
+        """(video, heure) -> [secondes regardees, battements, lectures, completions]"""
+        totals = into if into is not None else {}
+        for video_id, hour, elapsed, started, completed in events:
+            row = totals.get((video_id, hour))
+            if row is None:
+                row = totals[(video_id, hour)] = [0.0, 0, 0, 0]
+            row[0] += elapsed
+            row[1] += 1
+            row[2] += started
+            row[3] += completed
+        return totals
+
+    @staticmethod
+    def _write(rows):
+        from models import WatchTimeHourly
+        table = WatchTimeHourly.__table__
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            stmt = dialect_insert(table).values(rows[i:i + UPSERT_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.video_id, table.c.hour],
+                set_={
+                    name: table.c[name] + stmt.excluded[name]
+                    for name in ("watch_seconds", "heartbeats", "plays", "completions")
+                },
+            )
+            db.session.execute(stmt)
+        db.session.commit()
+
+    def flush(self) -> int:
+        from models import Video
+        totals, self._carry = self._carry, {}
+        self.aggregate(self.buffer.drain(), totals)
+        if not totals:
+            return 0
+        rows = []
+        try:
+            # Videos supprimees entre le battement et le flush : on ignore
+            existing = {
+                video_id for (video_id,) in db.session.query(Video.id)
+                .filter(Video.id.in_({video_id for video_id, _ in totals}))
+            }
+            valid = {}
+            for (video_id, hour), agg in totals.items():
+                if video_id not in existing:
+                    continue
+                if not math.isfinite(agg[0]):
+                    self.dropped += 1
+                    continue
+                valid[(video_id, hour)] = agg
+            rows = [
+                {"video_id": video_id, "hour": hour, "watch_seconds": agg[0],
+                 "heartbeats": agg[1], "plays": agg[2], "completions": agg[3]}
+                for (video_id, hour), agg in valid.items()
+            ]
+            self._write(rows)
+        except OperationalError as e:
+            db.session.rollback()
+            print(f"Erreur flush heartbeats: {e}")
+            # Base indisponible : agregats conserves pour le prochain passage
+            # (taille bornee par le nombre de couples video/heure)
+            self._carry = totals
+            return 0
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erreur flush heartbeats: {e}")
+            # Lot refuse pour ses donnees : ligne par ligne, les lignes refusees
+            # sont abandonnees au lieu de faire echouer tous les flushs suivants
+            return self._write_each(rows)
+        self.flushed += len(rows)
+        return len(rows)
+
+    def _write_each(self, rows) -> int:
+        written = 0
+        for row in rows:
+            try:
+                self._write([row])
+                written += 1
+            except Exception as e:
+                db.session.rollback()
+                self.dropped += 1
+                print(f"⚠ Battements abandonnes (video {row['video_id']}, {row['hour']}): {e}")
+        self.flushed += written
+        return written
+
+    def series(self, video_id: int, since: datetime):
+        from models import WatchTimeHourly
+        return (
+            WatchTimeHourly.query
+            .filter(WatchTimeHourly.video_id == video_id, WatchTimeHourly.hour >= since)
+            .order_by(WatchTimeHourly.hour)
+            .all()
+        )
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self.buffer),
+            "capacity": self.buffer.capacity,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "limited": self.limited,
+            "flushed_rows": self.flushed,
+            "dropped_rows": self.dropped,
+        }
+
+    def register(self, runner):
+        runner.every(FLUSH_INTERVAL, self.flush, "heartbeats: flush")
+
+
+heartbeats = HeartbeatIngestor()
@@ -0,0 +1,182 @@
+# hll.py
+"""Spectateurs uniques par video, estimes par HyperLogLog.
+
+Un sketch de 2^PRECISION registres (4096 octets, erreur type ~1.6 %)
+remplace une table exacte (visiteur, video). Deux sketches se fusionnent
+par maximum registre par registre : l'union est commutative et
+idempotente, donc chaque worker peut ecrire ses propres observations sans
+coordination, et un total sur plusieurs jours est la fusion des sketches
+journaliers.
+
+Stockage : sketch cumule dans videos.viewers_hll (+ estimation dans
+videos.unique_viewers pour l'affichage), sketches journaliers dans
+video_viewers. Les blobs sont compresses (zlib) : un sketch peu rempli
+ne pese que quelques dizaines d'octets.
+"""
+import hashlib
+import math
+import threading
+import zlib
+from datetime import date, datetime, timedelta
+
+from extensions import db
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+HASH_BITS = 64
+
+FLUSH_INTERVAL = 15          # secondes
+PURGE_INTERVAL = 3600
+RETENTION_DAYS = 90          # sketches journaliers conserves
+
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def register_of(value: int):
+    """(indice du registre, rang) pour un hash 64 bits."""
+    index = value >> (HASH_BITS - PRECISION)
+    rest = value & ((1 << (HASH_BITS - PRECISION)) - 1)
+    rank = (HASH_BITS - PRECISION) - rest.bit_length() + 1
+    return index, rank
+
+
+class HyperLogLog:
+    def __init__(self, registers: bytes = None):
+        self.registers = bytearray(registers) if registers else bytearray(REGISTERS)
+
+    @classmethod
+    def from_blob(cls, blob: bytes):
+        return cls(zlib.decompress(blob) if blob else None)
+
+    def to_blob(self) -> bytes:
+        return zlib.compress(bytes(self.registers), 6)
+
+    def add(self, key: str):
+        index, rank = register_of(hash_key(key))
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, sparse: dict):
+        """Applique des registres creux {indice: rang}."""
+        regs = self.registers
+        for index, rank in sparse.items():
+            if rank > regs[index]:
+                regs[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        m = REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / math.fsum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Petites cardinalites : comptage lineaire
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+def merge_sparse(target: dict, sparse: dict):
+    for index, rank in sparse.items():
+        if rank > target.get(index, 0):
+            target[index] = rank
+
+
+def merged(blobs) -> HyperLogLog:
+    sketch = HyperLogLog()
+    for blob in blobs:
+        if blob:
+            sketch.merge(HyperLogLog.from_blob(blob))
+    return sketch
+
+
+class ViewerCounter:
+    """Observations en memoire par worker, fusionnees en base par lots."""
+
+    def __init__(self):
+        self._pending = {}                   # (video_id, jour) -> {indice: rang}
+        self._lock = threading.Lock()
+
+    def record(self, video_id: int, visitor: str, day: date = None):
+        """Enregistre un visiteur (cout O(1), sans SQL)."""
+        index, rank = register_of(hash_key(visitor))
+        key = (video_id, day or datetime.utcnow().date())
+        with self._lock:
+            merge_sparse(self._pending.setdefault(key, {}), {index: rank})
+
+    def flush(self):
+        from models import Video, VideoViewers
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            video_ids = {video_id for video_id, _ in pending}
+            days = {day for _, day in pending}
+            rows = {
+                (row.video_id, row.day): row
+                for row in VideoViewers.query
+                .filter(VideoViewers.video_id.in_(video_ids), VideoViewers.day.in_(days))
+                .with_for_update()
+            }
+            totals = {}
+            for (video_id, day), sparse in pending.items():
+                row = rows.get((video_id, day))
+                sketch = HyperLogLog.from_blob(row.registers if row else None)
+                sketch.update(sparse)
+                if row is None:
+                    db.session.add(VideoViewers(video_id=video_id, day=day, registers=sketch.to_blob()))
+                else:
+                    row.registers = sketch.to_blob()
+                merge_sparse(totals.setdefault(video_id, {}), sparse)
+            videos = (
+                Video.query.options(db.undefer(Video.viewers_hll))
+                .filter(Video.id.in_(video_ids))
+                .with_for_update()
+            )
+            for video in videos:
+                sketch = HyperLogLog.from_blob(video.viewers_hll)
+                sketch.update(totals[video.id])
+                video.viewers_hll = sketch.to_blob()
+                video.unique_viewers = sketch.count()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erreur flush spectateurs uniques: {e}")
+            # On remet les observations en attente pour le prochain passage
+            with self._lock:
+                for key, sparse in pending.items():
+                    merge_sparse(self._pending.setdefault(key, {}), sparse)
+            return 0
+        return len(pending)
+
+    def unique_viewers(self, video_id: int, days: int = None) -> int:
+        """Spectateurs uniques depuis toujours, ou sur les `days` derniers jours."""
+        from models import Video, VideoViewers
+        if not days:
+            video = db.session.get(Video, video_id)
+            return (video.unique_viewers or 0) if video else 0
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        blobs = (
+            blob for (blob,) in db.session.query(VideoViewers.registers)
+            .filter(VideoViewers.video_id == video_id, VideoViewers.day >= since)
+        )
+        return merged(blobs).count()
+
+    def purge(self):
+        from models import VideoViewers
+        limit = datetime.utcnow().date() - timedelta(days=RETENTION_DAYS)
+        deleted = VideoViewers.query.filter(VideoViewers.day < limit).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def register(self, runner):
+        runner.every(FLUSH_INTERVAL, self.flush, "spectateurs uniques: flush")
+        runner.every(PURGE_INTERVAL, self.purge, "spectateurs uniques: purge")
+
+
+viewers = ViewerCounter()
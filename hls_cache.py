@@ -0,0 +1,155 @@
+# hls_cache.py
+"""Cache LRU en memoire (borne en octets) des playlists et segments HLS.
+
+Cle : (chemin, mtime) — un fichier reecrit sur disque invalide donc
+naturellement son ancienne entree, qui finit evincee par l'LRU.
+
+En fMP4 (HLS_OUTPUT_MODE=fmp4), chaque variante est un seul `stream.mp4`
+trop gros pour le cache : on y met alors les plages d'octets demandees par
+le lecteur (une par segment, cf. EXT-X-BYTERANGE), cle (chemin, mtime,
+debut, fin).
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+HLS_CACHE_MAX_BYTES = int(os.getenv("HLS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Les gros fichiers (MP4 fragmentes complets) restent servis depuis le disque
+HLS_CACHE_MAX_ITEM = int(os.getenv("HLS_CACHE_MAX_ITEM", str(4 * 1024 * 1024)))
+HLS_PREWARM_SEGMENTS = 3
+
+_BYTERANGE = re.compile(r'BYTERANGE[:=]"?(\d+)(?:@(\d+))?')
+_MAP_URI = re.compile(r'URI="([^"]+)"')
+
+
+class ByteLRUCache:
+    def __init__(self, max_bytes: int = HLS_CACHE_MAX_BYTES, max_item: int = HLS_CACHE_MAX_ITEM):
+        self.max_bytes = max_bytes
+        self.max_item = max_item
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value: bytes) -> bool:
+        if len(value) > self.max_item:
+            return False
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes and self._data:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+hls_cache = ByteLRUCache()
+
+
+def read_cached(path: str):
+    """Retourne (octets ou None, os.stat) pour `path`.
+
+    None si le fichier est trop gros pour le cache : l'appelant le sert alors
+    depuis le disque.
+    """
+    st = os.stat(path)
+    if st.st_size > hls_cache.max_item:
+        return None, st
+    key = (path, st.st_mtime_ns)
+    data = hls_cache.get(key)
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+        hls_cache.put(key, data)
+    return data, st
+
+
+def read_range_cached(path: str, st, start: int, stop: int) -> bytes:
+    """Octets [start, stop) d'un fichier trop gros pour read_cached()."""
+    key = (path, st.st_mtime_ns, start, stop)
+    data = hls_cache.get(key)
+    if data is None:
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(stop - start)
+        hls_cache.put(key, data)
+    return data
+
+
+def playlist_ranges(playlist_path: str):
+    """(fichier, debut, fin) de l'init (EXT-X-MAP) puis de chaque segment
+    adresse par plage d'octets, dans l'ordre de la playlist."""
+    ranges, offset, pending = [], 0, None
+    with open(playlist_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            m = _BYTERANGE.search(line)
+            if line.startswith("#EXT-X-MAP:") and m:
+                uri = _MAP_URI.search(line)
+                start = int(m.group(2) or 0)
+                if uri:
+                    ranges.append((uri.group(1), start, start + int(m.group(1))))
+            elif line.startswith("#EXT-X-BYTERANGE:") and m:
+                start = int(m.group(2)) if m.group(2) is not None else offset
+                pending = (start, start + int(m.group(1)))
+            elif line and not line.startswith("#") and pending:
+                ranges.append((line, *pending))
+                offset, pending = pending[1], None
+    return ranges
+
+
+def prewarm(video_dir: str, segments: int = HLS_PREWARM_SEGMENTS) -> int:
+    """Charge les playlists et les premiers segments de chaque variante
+    (fichiers entiers en ts, plages d'octets en fMP4)."""
+    loaded = 0
+    for root, _, files in os.walk(video_dir):
+        playlists = sorted(f for f in files if f.endswith(".m3u8"))
+        media = sorted(f for f in files if not f.endswith(".m3u8"))[:segments]
+        for name in playlists + media:
+            try:
+                data, _ = read_cached(os.path.join(root, name))
+                loaded += data is not None
+            except OSError:
+                pass
+        for name in playlists:
+            try:
+                # Init + premiers segments (l'init n'est pas compte comme segment)
+                for target, start, stop in playlist_ranges(os.path.join(root, name))[:segments + 1]:
+                    path = os.path.join(root, target)
+                    st = os.stat(path)
+                    if st.st_size > hls_cache.max_item:
+                        read_range_cached(path, st, start, stop)
+                        loaded += 1
+            except OSError:
+                pass
+    return loaded
@@ -0,0 +1,100 @@
+# hls_publisher.py
+"""Publication d'un dossier HLS vers le stockage.
+
+Les medias (segments, fichiers fMP4) sont envoyes en parallele via un pool
+de threads borne, puis les playlists de variantes, et la playlist maitre en
+dernier : un lecteur ne voit jamais une video a moitie publiee.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import storage
+
+PUBLISH_WORKERS = int(os.getenv("HLS_PUBLISH_WORKERS", "8"))
+PUBLISH_RETRIES = 3
+RETRY_BACKOFF = 0.5   # secondes, double a chaque tentative
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".ts": "video/mp2t",
+}
+
+
+@dataclass
+class PublishReport:
+    master_url: str
+    files: int
+    bytes: int
+    seconds: float
+
+    @property
+    def mbps(self) -> float:
+        return (self.bytes * 8 / 1_000_000) / self.seconds if self.seconds else 0.0
+
+
+def _upload_with_retry(key: str, path: str) -> int:
+    content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+    for attempt in range(PUBLISH_RETRIES):
+        try:
+            storage.upload_file(key, path, content_type, upsert=True)
+            return os.path.getsize(path)
+        except Exception as e:
+            if attempt == PUBLISH_RETRIES - 1:
+                raise
+            print(f"Erreur envoi {key} (tentative {attempt + 1}): {e}")
+            time.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+
+def _collect(local_dir: str):
+    """Repartit les fichiers en (medias, playlists de variantes, maitre)."""
+    media, playlists, master = [], [], None
+    for root, _, files in os.walk(local_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, local_dir).replace("\\", "/")
+            if rel == "master.m3u8":
+                master = (rel, path)
+            elif name.endswith(".m3u8"):
+                playlists.append((rel, path))
+            else:
+                media.append((rel, path))
+    if master is None:
+        raise FileNotFoundError(f"master.m3u8 absent de {local_dir}")
+    return media, playlists, master
+
+
+def _upload_batch(pool, key_prefix: str, items) -> int:
+    futures = {pool.submit(_upload_with_retry, f"{key_prefix}/{rel}", path): rel for rel, path in items}
+    total = 0
+    for future in as_completed(futures):
+        total += future.result()
+    return total
+
+
+def publish_hls(local_dir: str, key_prefix: str, workers: int = PUBLISH_WORKERS) -> PublishReport:
+    """Envoie le dossier HLS `local_dir` sous `key_prefix` et retourne le rapport."""
+    media, playlists, (master_rel, master_path) = _collect(local_dir)
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hls-publish") as pool:
+        sent = _upload_batch(pool, key_prefix, media)
+        sent += _upload_batch(pool, key_prefix, playlists)
+
+    sent += _upload_with_retry(f"{key_prefix}/{master_rel}", master_path)
+    elapsed = time.perf_counter() - started
+
+    report = PublishReport(
+        master_url=storage.public_url(f"{key_prefix}/{master_rel}"),
+        files=len(media) + len(playlists) + 1,
+        bytes=sent,
+        seconds=elapsed,
+    )
+    print(
+        f"✓ HLS publie: {report.files} fichiers, {report.bytes / 1_000_000:.1f} Mo "
+        f"en {report.seconds:.1f}s ({report.mbps:.1f} Mbit/s)"
+    )
+    return report
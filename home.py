@@ -1,8 +1,9 @@
 import os
+import math
 import time
 from flask import (
     Flask, request, render_template_string, url_for, redirect,
-    send_from_directory, abort, jsonify, flash, send_file
+    send_from_directory, abort, jsonify, flash, send_file, Response, session
 )
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -10,11 +11,15 @@ from flask_login import (
     LoginManager, UserMixin, login_user, login_required,
     logout_user, current_user
 )
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, safe_join
+from werkzeug.datastructures import ContentRange
+from werkzeug.middleware.proxy_fix import ProxyFix
+from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
 import subprocess
 import shutil
+import click
 from PIL import Image
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
@@ -32,10 +37,19 @@ HLS_DIR = os.path.join(BASE_DIR, "hls")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(HLS_DIR, exist_ok=True)
 
+# "fmp4" : un seul MP4 fragmente par qualite + playlists EXT-X-BYTERANGE
+# "ts"   : un fichier .ts par segment de 4 s (ancien mode)
+HLS_OUTPUT_MODE = os.getenv("HLS_OUTPUT_MODE", "fmp4")
+# Proxys de confiance devant l'app (Render : 1) ; 0 sans proxy
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
 # ------------------------------
 # Creation de l'application Flask
 # ------------------------------
 app = Flask(__name__)
+if TRUSTED_PROXY_HOPS:
+    # remote_addr = adresse vue par notre proxy, pas un X-Forwarded-For fourni par le client
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 
 # ------------------------------
 # Configuration de la base de donnees
@@ -93,7 +107,11 @@ except RuntimeError as e:
         raise
 
 # Import des modeles APRES l'initialisation
-from models import Video, Like, Xp, User, Follow, Comment
+from models import (
+    Video, Like, Xp, User, Follow, Comment, VideoRecommendation,
+    VideoCard, card_select, load_cards,
+    add_missing_columns, add_missing_indexes, recount_follows, recount_videos,
+)
 
 # ------------------------------
 # Création des tables et test de connexion
@@ -102,10 +120,18 @@ with app.app_context():
     try:
         # Test de connexion simple
         db.session.execute(text("SELECT 1")).scalar()
+        # Rend la connexion au pool (taille 1) avant create_all / inspection
+        db.session.remove()
         print("✓ Connexion DB réussie")
         
         # Crée les tables si elles n'existent pas
         db.create_all()
+        added = add_missing_columns()
+        add_missing_indexes()
+        if "users.followers_count" in added or "users.following_count" in added:
+            print(f"✓ Compteurs d'abonnements initialises: {recount_follows()} utilisateurs")
+        if "users.videos_count" in added:
+            print(f"✓ Compteurs de videos initialises: {recount_videos()} utilisateurs")
         print("✓ Tables créées/vérifiées")
     except Exception as e:
         print(f"⚠ Erreur DB: {type(e).__name__}: {str(e)[:100]}")
@@ -118,7 +144,8 @@ with app.app_context():
 @app.before_request
 def before_request():
     """Vérifie la connexion DB avant chaque requête"""
-    if request.endpoint not in ['static', 'favicon', None]:
+    # heartbeat : route sans SQL, appelee toutes les 15 s par chaque lecteur
+    if request.endpoint not in ['static', 'favicon', 'heartbeat', None]:
         try:
             db.session.execute(text("SELECT 1"))
         except Exception:
@@ -149,6 +176,14 @@ def load_user(user_id):
 # Supabase Storage centralise
 # ------------------------------
 from supabase_config import supabase, BUCKET_NAME
+import storage
+from thumbnails import generate_thumbnails
+from storyboard import generate_storyboard
+from probe import probe, ffprobe_exists
+from ladder import Rung, select_ladder, ffmpeg_ladder_args, source_codec, write_master_playlist
+from hls_publisher import publish_hls
+from hls_cache import hls_cache, read_cached, read_range_cached, prewarm
+from phash import video_phash, phash_index, to_signed
 
 # ------------------------------
 # Creation automatique des tables (Render inclus)
@@ -183,50 +218,228 @@ CATEGORIES = [
 CATEGORIES_MAP = {c["id"]: c for c in CATEGORIES}
 ALLOWED_EXTENSIONS = {"mp4", "webm", "ogg", "mov", "m4v"}
 
+# -------------------------
+# Taches de fond (un thread par worker) : tendances, suggestions, spectateurs,
+# heartbeats, statistiques quotidiennes
+# -------------------------
+from background import runner
+from trending import trending
+from suggestions import suggestions, parse_ids
+from hll import viewers
+from heartbeats import heartbeats, RETRY_AFTER
+from analytics import stats
+from video_cache import video_cache
+from shared_cache import shared_cache
+from singleflight import singleflight
+import feed
+import profiles
+from serialize import EXPORT_BATCH, VIDEO_FIELDS, json_response, ndjson_response, video_json, video_row
+trending.register(runner, CATEGORIES_MAP)
+suggestions.register(runner)
+viewers.register(runner)
+heartbeats.register(runner)
+stats.register(runner)
+video_cache.register(runner)
+
+def start_background():
+    """Demarre les threads de fond de ce processus. Appele seulement par le
+    serveur web (gunicorn.conf.py, app.run) : ni a l'import, ni pour les
+    commandes flask, ni dans les processus de l'importeur."""
+    runner.start(app)
+
 # -------------------------
 # Utils
 # -------------------------
+def visitor_key() -> str:
+    """Identifiant de visiteur pour les spectateurs uniques (jamais stocke en clair)."""
+    if current_user.is_authenticated:
+        return f"u:{current_user.id}"
+    return f"a:{request.remote_addr}|{request.headers.get('User-Agent', '')}"
+
+def admin_required(view):
+    """Routes de diagnostic : reservees aux administrateurs (403 sinon)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not (current_user.is_authenticated and current_user.is_admin):
+            return jsonify({"error": "Acces refuse"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def ffmpeg_exists() -> bool:
     return shutil.which("ffmpeg") is not None
 
-def transcode_to_hls(input_path: str, target_dir: str) -> str:
-    """Transcode en HLS multi-qualite (360p, 720p). Retourne chemin relatif du master.m3u8."""
-    os.makedirs(target_dir, exist_ok=True)
-    master_path = os.path.join(target_dir, "master.m3u8")
-    
+def _hls_muxer_args(target_dir: str, variant: str) -> list:
+    """Arguments du muxer HLS selon HLS_OUTPUT_MODE.
+
+    En fMP4, chaque qualite tient dans un seul fichier `stream.mp4` adresse
+    par plages d'octets : un objet de stockage au lieu de centaines de .ts.
+    """
+    args = ["-f", "hls", "-hls_time", "4", "-hls_playlist_type", "vod"]
+    if HLS_OUTPUT_MODE == "fmp4":
+        args += [
+            "-hls_segment_type", "fmp4", "-hls_flags", "single_file+independent_segments",
+            "-hls_segment_filename", os.path.join(target_dir, f"v{variant}/stream.mp4"),
+        ]
+    else:
+        args += ["-hls_segment_filename", os.path.join(target_dir, f"v{variant}/seg_%03d.ts")]
+    return args + [os.path.join(target_dir, f"v{variant}/index.m3u8")]
+
+def _hls_passthrough(input_path: str, target_dir: str, info) -> list:
+    """Segmente la source en HLS sans reencodage (codecs deja compatibles)."""
+    os.makedirs(os.path.join(target_dir, "v0"), exist_ok=True)
     cmd = [
         "ffmpeg", "-y", "-i", input_path,
-        "-filter:v:0", "scale=w=640:h=360:force_original_aspect_ratio=decrease",
-        "-c:a:0", "aac", "-ar:0", "48000", "-c:v:0", "h264", "-profile:v:0", "main",
-        "-crf:0", "23", "-sc_threshold", "0", "-g", "48", "-keyint_min", "48",
-        "-filter:v:1", "scale=w=1280:h=720:force_original_aspect_ratio=decrease",
-        "-c:a:1", "aac", "-ar:1", "48000", "-c:v:1", "h264", "-profile:v:1", "main",
-        "-crf:1", "21", "-sc_threshold", "0", "-g", "48", "-keyint_min", "48",
-        "-map", "0:v:0", "-map", "0:a:0?", "-map", "0:v:0", "-map", "0:a:0?",
-        "-var_stream_map", "v:0,a:0 v:1,a:1", "-master_pl_name", "master.m3u8",
-        "-f", "hls", "-hls_time", "4", "-hls_playlist_type", "vod",
-        "-hls_segment_filename", os.path.join(target_dir, "v%v/seg_%03d.ts"),
-        os.path.join(target_dir, "v%v/index.m3u8"),
-    ]
+        "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+    ] + _hls_muxer_args(target_dir, "0")
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    source = Rung(info.height, info.width, 0, 0, 0, "", codec=source_codec(info))
+    return [("v0", source)]
+
+def _hls_ladder(input_path: str, target_dir: str, info, has_audio: bool) -> list:
+    """Reencode la source selon l'echelle de qualites."""
+    rungs = select_ladder(info)
+    cmd = ["ffmpeg", "-y", "-i", input_path]
+    cmd += ffmpeg_ladder_args(rungs, has_audio=has_audio, info=info)
+    cmd += _hls_muxer_args(target_dir, "%v")
+    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    variants = [(f"v{i}", r) for i, r in enumerate(rungs)]
+    if has_audio:
+        variants.append((f"v{len(rungs)}", None))
+    return variants
+
+def transcode_to_hls(input_path: str, target_dir: str, info=None) -> str:
+    """Transcode en HLS selon l'echelle de qualites adaptee a la source.
+    Retourne chemin relatif du master.m3u8.
+
+    Avec les metadonnees ffprobe (`info`), les qualites superieures a la source
+    sont ignorees et une source deja conforme est segmentee sans reencodage.
+    Une variante audio seule est ajoutee pour les connexions tres lentes.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    master_path = os.path.join(target_dir, "master.m3u8")
+    has_audio = info is None or info.audio_codec is not None
 
-    try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg error:", e.stderr.decode(errors="ignore")[:2000])
-        raise
+    variants = None
+    # CODECS de la playlist maitre lu sur la source : profil H.264 reconnu requis
+    if info is not None and info.can_passthrough and source_codec(info):
+        try:
+            variants = _hls_passthrough(input_path, target_dir, info)
+        except subprocess.CalledProcessError as e:
+            print("FFmpeg passthrough error:", e.stderr.decode(errors="ignore")[:2000])
+
+    if variants is None:
+        try:
+            variants = _hls_ladder(input_path, target_dir, info, has_audio)
+        except subprocess.CalledProcessError as e:
+            if info is not None:
+                print("FFmpeg error:", e.stderr.decode(errors="ignore")[:2000])
+                raise
+            # Sans ffprobe, la piste audio n'est pas confirmee : nouvel essai sans
+            print("⚠ FFmpeg: echec avec audio, nouvel essai video seule")
+            has_audio = False
+            try:
+                variants = _hls_ladder(input_path, target_dir, info, has_audio)
+            except subprocess.CalledProcessError as e:
+                print("FFmpeg error:", e.stderr.decode(errors="ignore")[:2000])
+                raise
 
-    if not os.path.exists(master_path):
-        with open(master_path, "w", encoding="utf-8") as f:
-            f.write("#EXTM3U\n#EXT-X-VERSION:3\n")
-            f.write("#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\nv0/index.m3u8\n")
-            f.write("#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720\nv1/index.m3u8\n")
+    write_master_playlist(
+        target_dir, variants, has_audio=has_audio,
+        version=7 if HLS_OUTPUT_MODE == "fmp4" else 3, info=info,
+    )
 
     rel = os.path.relpath(master_path, HLS_DIR)
     return rel.replace("\\", "/")
 
+def probe_media(file_path: str):
+    """Metadonnees ffprobe du fichier, ou None si ffprobe est indisponible/echoue."""
+    if not ffprobe_exists():
+        return None
+    try:
+        info = probe(file_path)
+        print("DEBUG: metadonnees =", info)
+        return info
+    except Exception as e:
+        print(f"Erreur ffprobe: {e}")
+        return None
+
+def fingerprint_media(file_path: str, info=None):
+    """Empreinte perceptuelle (hash 64 bits) ou None si ffmpeg echoue."""
+    if not ffmpeg_exists():
+        return None
+    try:
+        return video_phash(file_path, info.duration if info else 0.0)
+    except Exception as e:
+        print(f"Erreur empreinte perceptuelle: {e}")
+        return None
+
+def process_media(file_path: str, final: str, content_type: str, info=None,
+                  to_hls: bool = False, upsert: bool = False) -> dict:
+    """Pipeline commun a l'upload et a l'import : envoi Supabase, miniatures,
+    storyboard et HLS. Retourne les champs du modele Video.
+
+    Seul l'echec de l'envoi de la video leve une exception ; les etapes
+    suivantes sont facultatives et journalisees.
+    """
+    stem = os.path.splitext(final)[0]
+    public_url = storage.upload_file(f"videos/{final}", file_path, content_type, upsert=upsert)
+    print("DEBUG: URL publique Supabase =", public_url)
+
+    thumb_url, thumb_srcset = None, None
+    try:
+        at_seconds = info.duration * 0.1 if info and info.duration else 3.0
+        thumb_url, thumb_srcset = generate_thumbnails(file_path, f"thumbs/{stem}", at_seconds, upsert=upsert)
+        print("DEBUG: miniatures generees =", thumb_url)
+    except Exception as e:
+        print(f"Erreur generation miniatures: {e}")
+
+    storyboard_url = None
+    try:
+        storyboard_url = generate_storyboard(file_path, f"storyboards/{stem}", upsert=upsert)
+        print("DEBUG: storyboard genere =", storyboard_url)
+    except Exception as e:
+        print(f"Erreur generation storyboard: {e}")
+
+    hls_manifest, hls_url = None, None
+    if to_hls and ffmpeg_exists():
+        try:
+            hls_manifest = transcode_to_hls(file_path, os.path.join(HLS_DIR, stem), info)
+            print("DEBUG: HLS genere =", hls_manifest)
+        except Exception as e:
+            print(f"Erreur transcodage HLS: {e}")
+    if hls_manifest:
+        local_dir = os.path.join(HLS_DIR, stem)
+        try:
+            hls_url = publish_hls(local_dir, f"hls/{stem}").master_url
+        except Exception as e:
+            # Reste servi par /hls depuis le disque local
+            print(f"Erreur publication HLS: {e}")
+            prewarm(local_dir)
+        else:
+            # Servi par le stockage (hls_url prioritaire) : la copie locale ne sert plus
+            shutil.rmtree(local_dir, ignore_errors=True)
+
+    return dict(
+        filename=final,
+        external_url=public_url,
+        thumb_url=thumb_url,
+        thumb_srcset=thumb_srcset,
+        storyboard_url=storyboard_url,
+        duration=info.duration_label if info else "",
+        duration_seconds=info.duration if info else None,
+        width=info.width if info else None,
+        height=info.height if info else None,
+        video_codec=info.video_codec if info else None,
+        audio_codec=info.audio_codec if info else None,
+        bitrate=info.bitrate if info else None,
+        hls_manifest=hls_manifest,
+        hls_url=hls_url,
+    )
+
 def init_db():
     """Initialise la base de donnees avec des donnees de test"""
     try:
@@ -306,6 +519,10 @@ BASE_HTML = """<!DOCTYPE html>
                                class="block px-4 py-3 text-gray-700 hover:bg-gray-100 rounded-t-lg">
                                 Profil
                             </a>
+                            <a href="{{ url_for('subscriptions_feed') }}" 
+                               class="block px-4 py-3 text-gray-700 hover:bg-gray-100">
+                                Abonnements
+                            </a>
                             <a href="{{ url_for('reglement') }}" 
                                class="block px-4 py-3 text-gray-700 hover:bg-gray-100">
                                 Reglement
@@ -517,7 +734,14 @@ HOME_BODY = """
             <div class="bg-white rounded-lg shadow-sm overflow-hidden hover:shadow-md transition">
                 <a href="{{ url_for('watch', video_id=video.id) }}">
                     {% if video.thumb_url %}
-                        <img src="{{ video.thumb_url }}" alt="{{ video.title }}" class="w-full h-48 object-cover">
+                        <picture>
+                            {% if video.thumb_srcset %}
+                            <source type="image/webp" srcset="{{ video.thumb_srcset }}"
+                                    sizes="(min-width: 1280px) 25vw, (min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw">
+                            {% endif %}
+                            <img src="{{ video.thumb_url }}" alt="{{ video.title }}" loading="lazy" decoding="async"
+                                 width="640" height="360" class="w-full h-48 object-cover">
+                        </picture>
                     {% else %}
                         <div class="w-full h-48 bg-gray-300 flex items-center justify-center">
                             <span class="text-gray-500">Pas de miniature</span>
@@ -543,22 +767,126 @@ HOME_BODY = """
 </main>
 """
 
+FEED_BODY = """
+<main class="container mx-auto px-4 py-8">
+    <h1 class="text-2xl font-bold mb-6">Abonnements</h1>
+    <div class="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
+        {% for video in items %}
+            <div class="bg-white rounded-lg shadow-sm overflow-hidden hover:shadow-md transition">
+                <a href="{{ url_for('watch', video_id=video.id) }}">
+                    {% if video.thumb_url %}
+                        <picture>
+                            {% if video.thumb_srcset %}
+                            <source type="image/webp" srcset="{{ video.thumb_srcset }}"
+                                    sizes="(min-width: 1280px) 25vw, (min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw">
+                            {% endif %}
+                            <img src="{{ video.thumb_url }}" alt="{{ video.title }}" loading="lazy" decoding="async"
+                                 width="640" height="360" class="w-full h-48 object-cover">
+                        </picture>
+                    {% else %}
+                        <div class="w-full h-48 bg-gray-300 flex items-center justify-center">
+                            <span class="text-gray-500">Pas de miniature</span>
+                        </div>
+                    {% endif %}
+                </a>
+                <div class="p-4">
+                    <h3 class="font-semibold mb-2">
+                        <a href="{{ url_for('watch', video_id=video.id) }}" class="hover:text-blue-600">
+                            {{ video.title }}
+                        </a>
+                    </h3>
+                    <p class="text-gray-600 text-sm">{{ video.creator }}</p>
+                    <p class="text-gray-500 text-sm">{{ video.views or 0 }} vues</p>
+                </div>
+            </div>
+        {% else %}
+            <div class="col-span-full text-center py-8">
+                <p class="text-gray-500">Aucune video de vos abonnements pour le moment.</p>
+            </div>
+        {% endfor %}
+    </div>
+    {% if next_cursor %}
+        <div class="text-center mt-8">
+            <a href="{{ url_for('subscriptions_feed', cursor=next_cursor) }}"
+               class="bg-blue-500 text-white px-6 py-2 rounded-lg hover:bg-blue-600">Videos plus anciennes</a>
+        </div>
+    {% endif %}
+</main>
+"""
+
+# Parties de la page video communes a tous les visiteurs (mises en cache)
+WATCH_COMMENTS_FRAGMENT = """
+{% for comment in comments %}
+    <div class="bg-white p-4 rounded-lg shadow-sm">
+        <div class="flex items-center space-x-2 mb-2">
+            <strong>{{ comment.user.display_name }}</strong>
+            <span class="text-gray-500 text-sm">{{ comment.created_at.strftime('%d %b %Y a %H:%M') }}</span>
+        </div>
+        <p>{{ comment.body }}</p>
+    </div>
+{% else %}
+    <p class="text-gray-500 text-center">Aucun commentaire pour le moment.</p>
+{% endfor %}
+"""
+
+WATCH_SUGGESTIONS_FRAGMENT = """
+{% for suggestion in more %}
+    <div class="bg-white rounded-lg shadow-sm overflow-hidden hover:shadow-md transition">
+        <a href="{{ url_for('watch', video_id=suggestion.id) }}">
+            {% if suggestion.thumb_url %}
+                <picture>
+                    {% if suggestion.thumb_srcset %}
+                    <source type="image/webp" srcset="{{ suggestion.thumb_srcset }}"
+                            sizes="(min-width: 1024px) 33vw, 100vw">
+                    {% endif %}
+                    <img src="{{ suggestion.thumb_url }}" alt="{{ suggestion.title }}" loading="lazy" decoding="async"
+                         width="640" height="360" class="w-full h-32 object-cover">
+                </picture>
+            {% else %}
+                <div class="w-full h-32 bg-gray-300 flex items-center justify-center">
+                    <span class="text-gray-500 text-xs">Pas de miniature</span>
+                </div>
+            {% endif %}
+        </a>
+        <div class="p-3">
+            <h4 class="font-medium text-sm mb-1">
+                <a href="{{ url_for('watch', video_id=suggestion.id) }}">{{ suggestion.title }}</a>
+            </h4>
+            <p class="text-gray-600 text-xs">{{ suggestion.creator }}</p>
+            <p class="text-gray-500 text-xs">{{ suggestion.views or 0 }} vues</p>
+        </div>
+    </div>
+{% else %}
+    <p class="text-gray-500 text-sm">Aucune suggestion disponible.</p>
+{% endfor %}
+"""
+
 WATCH_BODY = """
 <main class="container mx-auto px-4 py-8">
     <div class="grid grid-cols-1 lg:grid-cols-3 gap-8">
         <div class="lg:col-span-2">
             <div class="bg-black rounded-lg overflow-hidden mb-4">
-                <video id="video-player" controls class="w-full h-auto max-h-96">
-                    <source src="{{ video.source_url }}" type="video/mp4">
+                <video id="video-player" controls preload="metadata" poster="{{ video.thumb_url or '' }}" class="w-full h-auto max-h-96"{% if video.storyboard_url %} crossorigin="anonymous"{% endif %}>
+                    <source src="{{ video.source_url }}" type="{{ 'application/vnd.apple.mpegurl' if '.m3u8' in video.source_url else 'video/mp4' }}">
+                    {% if video.storyboard_url %}
+                    <track kind="metadata" id="storyboard-track" src="{{ video.storyboard_url }}" default>
+                    {% endif %}
                     Votre navigateur ne supporte pas la lecture video.
                 </video>
+                {% if video.storyboard_url %}
+                <div id="scrub-bar" class="relative h-2 bg-gray-700 cursor-pointer">
+                    <div id="scrub-progress" class="absolute inset-y-0 left-0 bg-blue-500" style="width: 0"></div>
+                    <div id="scrub-preview" class="hidden absolute bottom-4 border border-white shadow-lg"
+                         style="width: 160px; height: 90px; background-repeat: no-repeat;"></div>
+                </div>
+                {% endif %}
             </div>
             
             <h1 class="text-2xl font-bold mb-2">{{ video.title }}</h1>
             <div class="flex items-center justify-between mb-4">
                 <div>
                     <p class="text-gray-600">{{ video.creator }}</p>
-                    <p class="text-gray-500 text-sm">{{ video.views }} vues • {{ video.created_at.strftime('%d %b %Y') }}</p>
+                    <p class="text-gray-500 text-sm">{{ video.views }} vues{% if video.unique_viewers %} ({{ video.unique_viewers }} spectateurs uniques){% endif %} • {{ video.created_at.strftime('%d %b %Y') }}</p>
                 </div>
                 
                 {% if current_user.is_authenticated %}
@@ -597,45 +925,13 @@ WATCH_BODY = """
             {% endif %}
             
             <div class="space-y-4">
-                {% for comment in comments %}
-                    <div class="bg-white p-4 rounded-lg shadow-sm">
-                        <div class="flex items-center space-x-2 mb-2">
-                            <strong>{{ comment.user.display_name }}</strong>
-                            <span class="text-gray-500 text-sm">{{ comment.created_at.strftime('%d %b %Y a %H:%M') }}</span>
-                        </div>
-                        <p>{{ comment.body }}</p>
-                    </div>
-                {% else %}
-                    <p class="text-gray-500 text-center">Aucun commentaire pour le moment.</p>
-                {% endfor %}
+                {{ comments_html|safe }}
             </div>
         </div>
         
         <div class="space-y-4">
             <h3 class="font-semibold text-lg">Suggestions</h3>
-            {% for suggestion in more %}
-                <div class="bg-white rounded-lg shadow-sm overflow-hidden hover:shadow-md transition">
-                    <a href="{{ url_for('watch', video_id=suggestion.id) }}">
-                        {% if suggestion.thumb_url %}
-                            <img src="{{ suggestion.thumb_url }}" alt="{{ suggestion.title }}" 
-                                 class="w-full h-32 object-cover">
-                        {% else %}
-                            <div class="w-full h-32 bg-gray-300 flex items-center justify-center">
-                                <span class="text-gray-500 text-xs">Pas de miniature</span>
-                            </div>
-                        {% endif %}
-                    </a>
-                    <div class="p-3">
-                        <h4 class="font-medium text-sm mb-1">
-                            <a href="{{ url_for('watch', video_id=suggestion.id) }}">{{ suggestion.title }}</a>
-                        </h4>
-                        <p class="text-gray-600 text-xs">{{ suggestion.creator }}</p>
-                        <p class="text-gray-500 text-xs">{{ suggestion.views or 0 }} vues</p>
-                    </div>
-                </div>
-            {% else %}
-                <p class="text-gray-500 text-sm">Aucune suggestion disponible.</p>
-            {% endfor %}
+            {{ suggestions_html|safe }}
         </div>
     </div>
 </main>
@@ -672,6 +968,95 @@ function giveXp(videoId) {
 
 const video = document.getElementById('video-player');
 const videoSrc = '{{ video.source_url }}';
+
+// Apercu au survol : vignettes du storyboard WebVTT, sans charger de segment
+const scrubBar = document.getElementById('scrub-bar');
+const storyboardTrack = document.getElementById('storyboard-track');
+if (scrubBar && storyboardTrack) {
+    const preview = document.getElementById('scrub-preview');
+    const progress = document.getElementById('scrub-progress');
+    const track = storyboardTrack.track;
+    track.mode = 'hidden';
+
+    function cueAt(t) {
+        const cues = track.cues || [];
+        for (let i = 0; i < cues.length; i++) {
+            if (t >= cues[i].startTime && t < cues[i].endTime) return cues[i];
+        }
+        return null;
+    }
+
+    function timeFromEvent(e) {
+        const rect = scrubBar.getBoundingClientRect();
+        const ratio = Math.min(Math.max((e.clientX - rect.left) / rect.width, 0), 1);
+        return {ratio: ratio, time: ratio * (video.duration || 0), x: e.clientX - rect.left, width: rect.width};
+    }
+
+    scrubBar.addEventListener('mousemove', function (e) {
+        const pos = timeFromEvent(e);
+        const cue = cueAt(pos.time);
+        if (!cue) return;
+        const [file, frag] = cue.text.split('#xywh=');
+        const [x, y] = frag.split(',');
+        preview.style.backgroundImage = `url("${new URL(file, storyboardTrack.src)}")`;
+        preview.style.backgroundPosition = `-${x}px -${y}px`;
+        preview.style.left = `${Math.min(Math.max(pos.x - 80, 0), pos.width - 160)}px`;
+        preview.classList.remove('hidden');
+    });
+    scrubBar.addEventListener('mouseleave', function () { preview.classList.add('hidden'); });
+    scrubBar.addEventListener('click', function (e) {
+        if (video.duration) video.currentTime = timeFromEvent(e).time;
+    });
+    video.addEventListener('timeupdate', function () {
+        if (video.duration) progress.style.width = `${100 * video.currentTime / video.duration}%`;
+    });
+}
+// Battements de lecture : temps regarde et completion, envoyes toutes les ~15 s.
+// En cas de 429 le temps reste accumule et part au battement suivant.
+(function () {
+    const url = '/api/videos/{{ video.id }}/heartbeat';
+    let watched = 0, lastTime = null, counted = false, completed = false, retryAt = 0, inFlight = false;
+
+    video.addEventListener('timeupdate', function () {
+        const t = video.currentTime;
+        if (lastTime !== null && !video.paused) {
+            const delta = t - lastTime;
+            if (delta > 0 && delta < 2) watched += delta;   // ignore les sauts
+        }
+        lastTime = t;
+        if (watched >= 15) beat(false);
+    });
+    video.addEventListener('seeking', function () { lastTime = null; });
+    video.addEventListener('pause', function () { beat(false); });
+    video.addEventListener('ended', function () { beat(false); });
+    window.addEventListener('pagehide', function () { beat(true); });
+
+    function beat(unloading) {
+        const reachedEnd = video.duration > 0 && video.currentTime >= 0.9 * video.duration;
+        const data = {elapsed: watched, started: !counted, completed: reachedEnd && !completed};
+        if (data.elapsed < 0.5 && !data.completed) return;
+        if (inFlight || (!unloading && Date.now() < retryAt)) return;
+        const body = JSON.stringify(data);
+        const sent = function () {
+            watched = Math.max(watched - data.elapsed, 0);
+            counted = true;
+            completed = completed || data.completed;
+        };
+        if (unloading && navigator.sendBeacon) {
+            if (navigator.sendBeacon(url, new Blob([body], {type: 'application/json'}))) sent();
+            return;
+        }
+        inFlight = true;
+        fetch(url, {method: 'POST', headers: {'Content-Type': 'application/json'}, body: body, keepalive: true})
+            .then(r => {
+                if (r.status === 429) retryAt = Date.now() + 1000 * (parseInt(r.headers.get('Retry-After')) || 30);
+                else if (r.ok) sent();
+            })
+            .catch(() => { retryAt = Date.now() + 30000; })
+            .finally(() => { inFlight = false; });
+    }
+})();
+
 if (Hls.isSupported() && videoSrc.includes('.m3u8')) {
     const hls = new Hls();
     hls.loadSource(videoSrc);
@@ -812,7 +1197,7 @@ PROFIL_BODY = """
                     
                     <div class="flex space-x-6 text-sm">
                         <div>
-                            <span class="font-semibold text-gray-800">{{ videos|length }}</span>
+                            <span class="font-semibold text-gray-800">{{ user.videos_count }}</span>
                             <span class="text-gray-600">videos</span>
                         </div>
                         <div>
@@ -836,12 +1221,19 @@ PROFIL_BODY = """
             <h3 class="text-xl font-semibold mb-4">Videos de {{ user.display_name }}</h3>
             
             {% if videos %}
-                <div class="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
+                <div id="profile-videos" class="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
                     {% for v in videos %}
                         <div class="bg-gray-50 rounded-lg overflow-hidden hover:shadow-md transition">
                             <a href="{{ url_for('watch', video_id=v.id) }}">
                                 {% if v.thumb_url %}
-                                    <img src="{{ v.thumb_url }}" alt="{{ v.title }}" class="w-full h-40 object-cover">
+                                    <picture>
+                                        {% if v.thumb_srcset %}
+                                        <source type="image/webp" srcset="{{ v.thumb_srcset }}"
+                                                sizes="(min-width: 1024px) 300px, (min-width: 768px) 50vw, 100vw">
+                                        {% endif %}
+                                        <img src="{{ v.thumb_url }}" alt="{{ v.title }}" loading="lazy" decoding="async"
+                                             width="640" height="360" class="w-full h-40 object-cover">
+                                    </picture>
                                 {% else %}
                                     <div class="w-full h-40 bg-gray-300 flex items-center justify-center">
                                         <span class="text-gray-500">Pas de miniature</span>
@@ -860,6 +1252,14 @@ PROFIL_BODY = """
                         </div>
                     {% endfor %}
                 </div>
+                {% if next_cursor %}
+                <div class="text-center mt-6">
+                    <button id="more-videos" data-cursor="{{ next_cursor }}" onclick="loadMoreVideos({{ user.id }})"
+                            class="px-6 py-2 rounded-lg bg-gray-200 hover:bg-gray-300 transition">
+                        Voir plus
+                    </button>
+                </div>
+                {% endif %}
             {% else %}
                 <div class="text-center py-8 text-gray-500">
                     <svg class="w-16 h-16 mx-auto mb-4 text-gray-300" fill="none" stroke="currentColor" viewBox="0 0 24 24">
@@ -883,15 +1283,60 @@ function followUser(userId) {
             if (data.following) {
                 btn.textContent = 'Se desabonner';
                 btn.className = 'px-6 py-2 rounded-lg bg-gray-300 hover:bg-gray-400 transition';
-                followersCount.textContent = parseInt(followersCount.textContent) + 1;
             } else {
                 btn.textContent = "S'abonner";
                 btn.className = 'px-6 py-2 rounded-lg bg-blue-500 text-white hover:bg-blue-600 transition';
-                followersCount.textContent = Math.max(0, parseInt(followersCount.textContent) - 1);
             }
+            followersCount.textContent = data.followers_count;
         })
         .catch(err => console.error('Erreur follow:', err));
 }
+
+// Pages suivantes des videos (curseur renvoye par /api/users/<id>/videos)
+function loadMoreVideos(userId) {
+    const btn = document.getElementById('more-videos');
+    const grid = document.getElementById('profile-videos');
+    btn.disabled = true;
+    fetch(`/api/users/${userId}/videos?cursor=${encodeURIComponent(btn.dataset.cursor)}`)
+        .then(r => r.json())
+        .then(data => {
+            data.items.forEach(v => {
+                const card = document.createElement('div');
+                card.className = 'bg-gray-50 rounded-lg overflow-hidden hover:shadow-md transition';
+                const link = document.createElement('a');
+                link.href = v.url;
+                if (v.thumb_url) {
+                    const img = document.createElement('img');
+                    img.src = v.thumb_url;
+                    img.alt = v.title;
+                    img.loading = 'lazy';
+                    img.className = 'w-full h-40 object-cover';
+                    link.appendChild(img);
+                }
+                const info = document.createElement('div');
+                info.className = 'p-3';
+                const title = document.createElement('h4');
+                title.className = 'font-semibold text-sm mb-1';
+                title.textContent = v.title;
+                const views = document.createElement('p');
+                views.className = 'text-gray-500 text-xs';
+                views.textContent = `${v.views || 0} vues`;
+                const date = document.createElement('p');
+                date.className = 'text-gray-400 text-xs';
+                date.textContent = new Date(v.created_at).toLocaleDateString('fr-FR', {day: '2-digit', month: 'short', year: 'numeric'});
+                info.append(title, views, date);
+                card.append(link, info);
+                grid.appendChild(card);
+            });
+            if (data.next_cursor) {
+                btn.dataset.cursor = data.next_cursor;
+                btn.disabled = false;
+            } else {
+                btn.remove();
+            }
+        })
+        .catch(err => { console.error('Erreur chargement videos:', err); btn.disabled = false; });
+}
 </script>
 """
 
@@ -1251,32 +1696,75 @@ def home():
     try:
         q = (request.args.get("q") or "").strip()
         active_cat = request.args.get("cat") or CATEGORIES[0]["id"]
-
-        query = Video.query.filter_by(category=active_cat)
+        if active_cat not in CATEGORIES_MAP:
+            # Pas une cle de cache par valeur inventee
+            active_cat = CATEGORIES[0]["id"]
+
+        def render_grid():
+            items = None
+            if active_cat == "tendance" and not q:
+                # Onglet Tendances : classement precalcule, toutes categories
+                items = video_cache.get_many(trending.top(limit=40))
+
+            if not items:
+                query = card_select().where(Video.category == active_cat)
+                if q:
+                    like = f"%{q}%"
+                    query = query.where(db.or_(Video.title.ilike(like), Video.creator.ilike(like)))
+                items = load_cards(query.order_by(Video.created_at.desc()).limit(40))
+
+            return render_template_string(
+                HOME_BODY,
+                q=q,
+                active_cat=active_cat,
+                items=items,
+                categories=CATEGORIES,
+                categories_map=CATEGORIES_MAP,
+            )
+
+        # Grille sans recherche : identique pour tous, partagee entre workers et
+        # recalculee par une seule requete a la fois
         if q:
-            like = f"%{q}%"
-            query = query.filter(db.or_(Video.title.ilike(like), Video.creator.ilike(like)))
-        items = query.order_by(Video.created_at.desc()).limit(40).all()
-
-        body = render_template_string(
-            HOME_BODY,
-            q=q,
-            active_cat=active_cat,
-            items=items,
-            categories=CATEGORIES,
-            categories_map=CATEGORIES_MAP,
-        )
+            body = render_grid()
+        else:
+            body = singleflight.fragment(f"home:{active_cat}", render_grid)
         return render_template_string(BASE_HTML, body=body, year=datetime.utcnow().year, title="Mitabo - Accueil")
     except Exception as e:
         print(f"Erreur dans home(): {e}")
         return f"Erreur: {e}", 500
 
+@app.get("/abonnements")
+@login_required
+def subscriptions_feed():
+    try:
+        items, next_cursor = feed.page(current_user.id, request.args.get("cursor"))
+        body = render_template_string(FEED_BODY, items=items, next_cursor=next_cursor)
+        return render_template_string(BASE_HTML, body=body, year=datetime.utcnow().year, title="Mitabo - Abonnements")
+    except Exception as e:
+        print(f"Erreur dans subscriptions_feed(): {e}")
+        return f"Erreur: {e}", 500
+
 @app.get("/watch/<int:video_id>")
 def watch(video_id: int):
     try:
-        v = Video.query.get_or_404(video_id)
-        v.views = (v.views or 0) + 1
+        v = video_cache.get(video_id)
+        if v is None:
+            return "Video introuvable", 404
+        # Compteur incremente en base sans charger l'entite ; le cache n'est pas invalide
+        views = db.session.execute(
+            db.update(Video)
+            .where(Video.id == v.id)
+            .values(views=db.func.coalesce(Video.views, 0) + 1)
+            .returning(Video.views)
+        ).scalar()
         db.session.commit()
+        if views is None:
+            video_cache.invalidate([v.id])
+            return "Video introuvable", 404
+        v = v._replace(views=views)
+        trending.record(v.id, v.category, "view")
+        viewers.record(v.id, visitor_key())
+        stats.record(v.id, v.user_id, "views")
 
         user_like = None
         is_following = False
@@ -1287,25 +1775,40 @@ def watch(video_id: int):
                     follower_id=current_user.id, followed_id=v.user_id
                 ).first() is not None
 
-        more = (
-            Video.query.filter(Video.id != v.id, Video.category == v.category)
-            .order_by(Video.created_at.desc())
-            .limit(8)
-            .all()
-        )
-
-        comments = (
-            Comment.query
-            .filter(Comment.video_id == v.id)
-            .order_by(Comment.created_at.desc())
-            .all()
-        )
-
+        def render_suggestions():
+            # Suggestions precalculees : lecture par cle primaire + multi-get
+            suggested = suggestions.get(v.id)
+            if suggested is None:
+                # Jamais calculees ; une liste vide stockee ne se recalcule pas ici
+                runner.submit(suggestions.refresh_neighbours, v.id)
+            more = video_cache.get_many(suggested[:8]) if suggested else []
+            if not more:
+                more = load_cards(
+                    card_select()
+                    .where(Video.id != v.id, Video.category == v.category)
+                    .order_by(Video.created_at.desc())
+                    .limit(8)
+                )
+            return render_template_string(WATCH_SUGGESTIONS_FRAGMENT, more=more)
+
+        def render_comments():
+            comments = (
+                Comment.query
+                .options(db.joinedload(Comment.user))
+                .filter(Comment.video_id == v.id)
+                .order_by(Comment.created_at.desc())
+                .all()
+            )
+            # Tous les commentaires ; un fil trop long pour une case du cache
+            # partage est rendu a chaque requete (cle uncacheable:, cf. singleflight)
+            return render_template_string(WATCH_COMMENTS_FRAGMENT, comments=comments)
+
+        # Parties communes a tous les visiteurs : une seule requete les recalcule
         body = render_template_string(
             WATCH_BODY,
             video=v,
-            more=more,
-            comments=comments,
+            suggestions_html=singleflight.fragment(f"watch:{v.id}:suggestions", render_suggestions),
+            comments_html=singleflight.fragment(f"watch:{v.id}:comments", render_comments),
             user_like=user_like,
             is_following=is_following
         )
@@ -1360,48 +1863,58 @@ def upload_post():
         f.save(file_path)
         print("DEBUG: fichier sauvegarde =", file_path)
 
-        public_url = None
-        if supabase:
-            try:
-                with open(file_path, "rb") as file_data:
-                    res = supabase.storage.from_(BUCKET_NAME).upload(
-                        f"videos/{final}",
-                        file_data,
-                        {"content-type": f.mimetype or "video/mp4"}
-                    )
-                print("DEBUG: reponse Supabase =", res)
-
-                public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(f"videos/{final}")
-                print("DEBUG: URL publique Supabase =", public_url)
+        # Metadonnees lues dans l'en-tete : on refuse avant tout envoi/encodage
+        info = probe_media(file_path)
+        error = info.duration_error() if info else None
+        if error:
+            flash(error)
+            os.remove(file_path)
+            return redirect(url_for("upload_form"))
 
-            except Exception as e:
-                print(f"Erreur upload vers Supabase: {e}")
-                flash(f"Erreur lors de l'upload Supabase: {e}")
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                return redirect(url_for("upload_form"))
-        else:
+        if not supabase:
             flash("Supabase non configure - impossible d'uploader")
             return redirect(url_for("upload_form"))
 
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print("DEBUG: fichier local supprime apres upload Supabase")
+        # Re-upload d'une video existante : signale, et pas de transcodage HLS
+        fingerprint = fingerprint_media(file_path, info)
+        duplicate_of = None
+        if fingerprint is not None:
+            matches = phash_index.find_duplicates(fingerprint)
+            if matches:
+                duplicate_of = matches[0][1]
+                to_hls = False
+                print(f"DEBUG: doublon probable de la video {duplicate_of} (distance {matches[0][0]})")
+                flash("Cette video ressemble a une video deja publiee : elle a ete signalee.")
+
+        try:
+            fields = process_media(file_path, final, f.mimetype or "video/mp4", info, to_hls)
+        except Exception as e:
+            print(f"Erreur upload vers Supabase: {e}")
+            flash(f"Erreur lors de l'upload Supabase: {e}")
+            return redirect(url_for("upload_form"))
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                print("DEBUG: fichier local supprime apres upload Supabase")
 
         v = Video(
             title=title,
             description=description,
             category=category if category in CATEGORIES_MAP else "tendance",
-            filename=final,
-            thumb_url=f"https://picsum.photos/seed/mitabo-{base}/640/360",
-            duration="",
             creator=creator,
             user_id=current_user.id,
-            external_url=public_url
+            phash=to_signed(fingerprint) if fingerprint is not None else None,
+            duplicate_of=duplicate_of,
+            **fields
         )
 
         db.session.add(v)
+        User.query.filter_by(id=current_user.id).update(
+            {User.videos_count: User.videos_count + 1}, synchronize_session=False
+        )
         db.session.commit()
+        runner.submit(suggestions.refresh_neighbours, v.id)
+        runner.submit(feed.fanout, v.id)
 
         flash("Video uploadee avec succes sur Supabase !")
         return redirect(url_for("watch", video_id=v.id))
@@ -1413,14 +1926,137 @@ def upload_post():
         flash(f"Erreur lors de l'upload: {e}")
         return redirect(url_for("upload_form"))
 
+HLS_MIMETYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".ts": "video/mp2t",
+}
+
 @app.get("/hls/<path:filename>")
 def hls(filename):
+    """Sert playlists et medias HLS, depuis le cache LRU memoire si possible.
+    Les requetes Range (fMP4 a plages d'octets) donnent des reponses 206 ;
+    sur un stream.mp4 trop gros pour le cache, chaque plage est mise en cache."""
     try:
-        return send_from_directory(HLS_DIR, filename, as_attachment=False)
+        mimetype = HLS_MIMETYPES.get(os.path.splitext(filename)[1].lower())
+        path = safe_join(HLS_DIR, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        data, st = read_cached(path)
+        if data is None:
+            bounds = request.range.range_for_length(st.st_size) if request.range else None
+            if bounds is None or bounds[1] - bounds[0] > hls_cache.max_item or "If-Range" in request.headers:
+                return send_from_directory(HLS_DIR, filename, as_attachment=False, mimetype=mimetype, conditional=True)
+            resp = Response(read_range_cached(path, st, *bounds), status=206,
+                            mimetype=mimetype or "application/octet-stream")
+            resp.content_range = ContentRange("bytes", bounds[0], bounds[1], st.st_size)
+            resp.accept_ranges = "bytes"
+            resp.set_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+            resp.last_modified = st.st_mtime
+            resp.cache_control.public = True
+            resp.cache_control.max_age = 86400
+            return resp
+
+        resp = Response(data, mimetype=mimetype or "application/octet-stream")
+        resp.set_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+        resp.last_modified = st.st_mtime
+        resp.cache_control.public = True
+        resp.cache_control.max_age = 300 if filename.endswith(".m3u8") else 86400
+        return resp.make_conditional(request, accept_ranges=True, complete_length=len(data))
     except Exception as e:
         print(f"Erreur dans hls(): {e}")
         abort(404)
 
+@app.get("/api/hls-cache/stats")
+@admin_required
+def hls_cache_stats():
+    """Statistiques du cache HLS de ce worker"""
+    return jsonify(hls_cache.stats())
+
+@app.post("/api/videos/<int:video_id>/heartbeat")
+def heartbeat(video_id: int):
+    """Battement de lecture : mis en tampon, agrege en tache de fond (aucun SQL ici)"""
+    try:
+        data = request.get_json(force=True, silent=True)
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Battement invalide"}), 400
+        # JSON accepte NaN / Infinity : ils empoisonneraient les agregats
+        elapsed = float(data.get("elapsed") or 0)
+        if not math.isfinite(elapsed):
+            return jsonify({"error": "Battement invalide"}), 400
+        # Par utilisateur connecte (id lu dans le cookie de session, sans charger
+        # current_user), sinon par adresse IP (cf. ProxyFix)
+        user_id = session.get("_user_id")
+        client = f"u:{user_id}" if user_id else f"a:{request.remote_addr}"
+        accepted = heartbeats.ingest(
+            video_id,
+            elapsed,
+            started=data.get("started", False),
+            completed=data.get("completed", False),
+            client=client,
+        )
+        if not accepted:
+            resp = jsonify({"error": "Trop de battements, reessayez plus tard"})
+            resp.status_code = 429
+            resp.headers["Retry-After"] = str(RETRY_AFTER)
+            return resp
+        return "", 204
+    except (TypeError, ValueError):
+        return jsonify({"error": "Battement invalide"}), 400
+    except Exception as e:
+        print(f"Erreur dans heartbeat(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/videos/<int:video_id>/watchtime")
+def api_watchtime(video_id: int):
+    """Temps de visionnage et taux de completion, par heure"""
+    try:
+        hours = min(max(int(request.args.get("hours", 48)), 1), 24 * 90)
+        since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+        rows = heartbeats.series(video_id, since)
+        plays = sum(r.plays for r in rows)
+        return jsonify({
+            "video_id": video_id,
+            "watch_seconds": sum(r.watch_seconds for r in rows),
+            "plays": plays,
+            "completion_rate": sum(r.completions for r in rows) / plays if plays else None,
+            "hours": [
+                {
+                    "hour": r.hour.isoformat(),
+                    "watch_seconds": r.watch_seconds,
+                    "plays": r.plays,
+                    "completions": r.completions,
+                    "completion_rate": r.completions / r.plays if r.plays else None,
+                }
+                for r in rows
+            ],
+        })
+    except Exception as e:
+        print(f"Erreur dans api_watchtime(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/heartbeats/stats")
+@admin_required
+def heartbeats_stats():
+    """Statistiques du tampon de battements de ce worker"""
+    return jsonify(heartbeats.stats())
+
+@app.get("/api/cache/stats")
+@admin_required
+def video_cache_stats():
+    """Taux de succes et taille du cache de videos de ce worker"""
+    return jsonify(video_cache.stats())
+
+@app.get("/api/cache/shared/stats")
+@admin_required
+def shared_cache_stats():
+    """Occupation du cache partage (tous workers) et taux de succes des fragments (ce worker)"""
+    return jsonify({**shared_cache.stats(), "fragments": singleflight.stats()})
+
 @app.get("/media/<path:filename>")
 def media(filename):
     """Route pour servir les fichiers video uploades localement"""
@@ -1437,7 +2073,9 @@ def media(filename):
 @login_required
 def comment_post(video_id: int):
     try:
-        v = Video.query.get_or_404(video_id)
+        v = video_cache.get(video_id)
+        if v is None:
+            return "Video introuvable", 404
         body = (request.form.get("body") or "").strip()
         if not body:
             flash("Commentaire vide")
@@ -1445,6 +2083,8 @@ def comment_post(video_id: int):
         c = Comment(video_id=v.id, user_id=current_user.id, body=body)
         db.session.add(c)
         db.session.commit()
+        singleflight.invalidate(f"watch:{v.id}:comments")
+        stats.record(v.id, v.user_id, "comments")
         return redirect(url_for("watch", video_id=v.id))
     except Exception as e:
         print(f"Erreur dans comment_post(): {e}")
@@ -1454,32 +2094,126 @@ def comment_post(video_id: int):
 # -------------------------
 # API minimale
 # -------------------------
+def _video_filters() -> list:
+    """Filtres ?q= et ?cat= communs a la liste et a l'export"""
+    q = (request.args.get("q") or "").strip()
+    cat = request.args.get("cat") or None
+    filters = []
+    if cat:
+        filters.append(Video.category == cat)
+    if q:
+        like = f"%{q}%"
+        filters.append(db.or_(Video.title.ilike(like), Video.creator.ilike(like)))
+    return filters
+
 @app.get("/api/videos")
 def api_videos():
     try:
         page = max(int(request.args.get("page", 1)), 1)
         per_page = min(max(int(request.args.get("per_page", 12)), 1), 50)
-        q = (request.args.get("q") or "").strip()
-        cat = request.args.get("cat") or None
+        filters = _video_filters()
 
-        query = Video.query
-        if cat:
-            query = query.filter_by(category=cat)
-        if q:
-            like = f"%{q}%"
-            query = query.filter(db.or_(Video.title.ilike(like), Video.creator.ilike(like)))
-
-        total = query.count()
-        items = (
-            query.order_by(Video.created_at.desc())
+        total = db.session.scalar(db.select(db.func.count(Video.id)).where(*filters))
+        items = load_cards(
+            card_select().where(*filters)
+            .order_by(Video.created_at.desc())
             .offset((page - 1) * per_page)
             .limit(per_page)
-            .all()
         )
-        return jsonify({
+        return json_response({
             "page": page,
             "per_page": per_page,
             "total": total,
+            "items": [video_json(v) for v in items],
+        })
+    except Exception as e:
+        print(f"Erreur dans api_videos(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/videos/export")
+def api_videos_export():
+    """Export complet en NDJSON (une video par ligne), lu par lots et diffuse"""
+    try:
+        stmt = (
+            card_select().where(*_video_filters())
+            .order_by(Video.id)
+            .execution_options(yield_per=EXPORT_BATCH)
+        )
+        rows = (video_json(VideoCard._make(row)) for row in db.session.execute(stmt))
+        return ndjson_response(rows, filename="videos.ndjson")
+    except Exception as e:
+        print(f"Erreur dans api_videos_export(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+BATCH_MAX_IDS = 200
+
+def _batch_ids():
+    """?ids=1,2,3 -> ids uniques dans l'ordre ; ValueError si invalide ou trop long"""
+    ids = list(dict.fromkeys(int(x) for x in (request.args.get("ids") or "").split(",") if x.strip()))
+    if len(ids) > BATCH_MAX_IDS:
+        raise ValueError(f"{BATCH_MAX_IDS} ids maximum")
+    return ids
+
+@app.get("/api/videos/batch")
+def api_videos_batch():
+    """Multi-get de cartes : une requete IN, reponse en tableaux (fields + items)"""
+    try:
+        try:
+            ids = _batch_ids()
+        except ValueError as e:
+            return jsonify({"error": f"Parametre ids invalide: {e}"}), 400
+        cards = video_cache.get_many(ids)
+        found = {card.id for card in cards}
+        return json_response({
+            "fields": VIDEO_FIELDS,
+            "items": [video_row(card) for card in cards],
+            "missing": [i for i in ids if i not in found],
+        })
+    except Exception as e:
+        print(f"Erreur dans api_videos_batch(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/me/engagement")
+@login_required
+def api_my_engagement():
+    """Etat like/dislike/XP de l'utilisateur pour une grille, en une requete.
+
+    Tableaux alignes sur `ids` : reaction 1 (like), -1 (dislike), 0 ; xp 1/0.
+    """
+    try:
+        try:
+            ids = _batch_ids()
+        except ValueError as e:
+            return jsonify({"error": f"Parametre ids invalide: {e}"}), 400
+        reaction = dict.fromkeys(ids, 0)
+        xp = dict.fromkeys(ids, 0)
+        if ids:
+            likes = db.select(
+                Like.video_id, db.case((Like.is_like, 1), else_=-1).label("value"),
+                db.literal("reaction").label("kind"),
+            ).where(Like.user_id == current_user.id, Like.video_id.in_(ids))
+            xps = db.select(
+                Xp.video_id, db.literal(1).label("value"), db.literal("xp").label("kind"),
+            ).where(Xp.user_id == current_user.id, Xp.video_id.in_(ids))
+            for video_id, value, kind in db.session.execute(db.union_all(likes, xps)):
+                (reaction if kind == "reaction" else xp)[video_id] = value
+        return json_response({
+            "ids": ids,
+            "reaction": [reaction[i] for i in ids],
+            "xp": [xp[i] for i in ids],
+        })
+    except Exception as e:
+        print(f"Erreur dans api_my_engagement(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/feed")
+@login_required
+def api_feed():
+    try:
+        limit = min(max(int(request.args.get("limit", feed.PAGE_SIZE)), 1), 50)
+        items, next_cursor = feed.page(current_user.id, request.args.get("cursor"), limit)
+        return jsonify({
+            "next_cursor": next_cursor,
             "items": [
                 {
                     "id": v.id,
@@ -1488,15 +2222,134 @@ def api_videos():
                     "category": v.category,
                     "views": v.views,
                     "thumb_url": v.thumb_url,
-                    "source_url": v.source_url,
-                    "hls": bool(v.hls_manifest),
                     "created_at": v.created_at.isoformat(),
                 }
                 for v in items
             ],
         })
     except Exception as e:
-        print(f"Erreur dans api_videos(): {e}")
+        print(f"Erreur dans api_feed(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/videos/<int:video_id>/viewers")
+def api_viewers(video_id: int):
+    """Spectateurs uniques (HyperLogLog) : total et fenetre glissante de `days` jours"""
+    try:
+        if db.session.get(Video, video_id) is None:
+            return jsonify({"error": "Video introuvable"}), 404
+        days = min(max(int(request.args.get("days", 7)), 1), 90)
+        return jsonify({
+            "video_id": video_id,
+            "unique_viewers": viewers.unique_viewers(video_id),
+            "days": days,
+            "unique_viewers_window": viewers.unique_viewers(video_id, days),
+        })
+    except Exception as e:
+        print(f"Erreur dans api_viewers(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+def _page_limit() -> int:
+    return min(max(int(request.args.get("limit", profiles.PAGE_SIZE)), 1), 50)
+
+@app.get("/api/users/<int:user_id>/videos")
+def api_user_videos(user_id: int):
+    try:
+        rows, next_cursor = profiles.user_videos(user_id, request.args.get("cursor"), _page_limit())
+        return jsonify({
+            "next_cursor": next_cursor,
+            "items": [
+                {
+                    "id": r.id,
+                    "title": r.title,
+                    "url": url_for("watch", video_id=r.id),
+                    "thumb_url": r.thumb_url,
+                    "views": r.views,
+                    "created_at": r.created_at.isoformat(),
+                }
+                for r in rows
+            ],
+        })
+    except Exception as e:
+        print(f"Erreur dans api_user_videos(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+def _users_page(fetch, user_id: int):
+    rows, next_cursor = fetch(user_id, request.args.get("cursor"), _page_limit())
+    return jsonify({
+        "next_cursor": next_cursor,
+        "items": [
+            {
+                "id": r.id,
+                "display_name": r.display_name,
+                "avatar_url": r.avatar_url,
+                "followers_count": r.followers_count,
+                "profile_url": url_for("show_profil", username=r.display_name),
+                "since": r.cursor_at.isoformat(),
+            }
+            for r in rows
+        ],
+    })
+
+@app.get("/api/users/<int:user_id>/followers")
+def api_user_followers(user_id: int):
+    try:
+        return _users_page(profiles.followers, user_id)
+    except Exception as e:
+        print(f"Erreur dans api_user_followers(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/users/<int:user_id>/following")
+def api_user_following(user_id: int):
+    try:
+        return _users_page(profiles.following, user_id)
+    except Exception as e:
+        print(f"Erreur dans api_user_following(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/creators/<int:user_id>/stats")
+@login_required
+def api_creator_stats(user_id: int):
+    """Tableau de bord createur (le createur lui-meme ou un admin), lu
+    uniquement depuis les agregats quotidiens"""
+    try:
+        if current_user.id != user_id and not current_user.is_admin:
+            return jsonify({"error": "Acces refuse"}), 403
+        if db.session.get(User, user_id) is None:
+            return jsonify({"error": "Createur introuvable"}), 404
+        days = min(max(int(request.args.get("days", 30)), 1), 365)
+        return jsonify(stats.creator_stats(user_id, days))
+    except Exception as e:
+        print(f"Erreur dans api_creator_stats(): {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/videos/<int:video_id>/recommendations")
+def api_recommendations(video_id: int):
+    """Voisins par co-likes, precalcules par `flask build-recommendations`"""
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+        row = db.session.get(VideoRecommendation, video_id)
+        if row is None:
+            return jsonify({"video_id": video_id, "items": []})
+        ids = parse_ids(row.recommended_ids)[:limit]
+        scores = [float(x) for x in row.scores.split(",") if x][:limit]
+        by_id = {card.id: card for card in video_cache.get_many(ids)}
+        return jsonify({
+            "video_id": video_id,
+            "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+            "items": [
+                {
+                    "id": by_id[i].id,
+                    "title": by_id[i].title,
+                    "creator": by_id[i].creator,
+                    "category": by_id[i].category,
+                    "thumb_url": by_id[i].thumb_url,
+                    "score": score,
+                }
+                for i, score in zip(ids, scores) if i in by_id
+            ],
+        })
+    except Exception as e:
+        print(f"Erreur dans api_recommendations(): {e}")
         return jsonify({"error": str(e)}), 500
 
 # -------------------------
@@ -1506,18 +2359,32 @@ def api_videos():
 @login_required
 def like_video(video_id):
     try:
-        v = Video.query.get_or_404(video_id)
+        v = video_cache.get(video_id)
+        if v is None:
+            return jsonify({"error": "Video introuvable"}), 404
 
         existing = Like.query.filter_by(user_id=current_user.id, video_id=v.id).first()
+        liked = False
+        deltas = {}
         if existing:
             if existing.is_like:
                 db.session.delete(existing)
+                deltas = {"likes": -1}
             else:
                 existing.is_like = True
+                liked = True
+                deltas = {"likes": 1, "dislikes": -1}
         else:
             db.session.add(Like(user_id=current_user.id, video_id=v.id, is_like=True))
+            liked = True
+            deltas = {"likes": 1}
 
         db.session.commit()
+        for field, delta in deltas.items():
+            stats.record(v.id, v.user_id, field, delta)
+        if liked:
+            trending.record(v.id, v.category, "like")
+            runner.submit(suggestions.refresh_neighbours, v.id)
         return jsonify({"likes": v.likes, "dislikes": v.dislikes})
     except Exception as e:
         print(f"Erreur dans like_video(): {e}")
@@ -1527,18 +2394,25 @@ def like_video(video_id):
 @login_required
 def dislike_video(video_id):
     try:
-        v = Video.query.get_or_404(video_id)
+        v = video_cache.get(video_id)
+        if v is None:
+            return jsonify({"error": "Video introuvable"}), 404
 
         existing = Like.query.filter_by(user_id=current_user.id, video_id=v.id).first()
         if existing:
             if not existing.is_like:
                 db.session.delete(existing)
+                deltas = {"dislikes": -1}
             else:
                 existing.is_like = False
+                deltas = {"dislikes": 1, "likes": -1}
         else:
             db.session.add(Like(user_id=current_user.id, video_id=v.id, is_like=False))
+            deltas = {"dislikes": 1}
 
         db.session.commit()
+        for field, delta in deltas.items():
+            stats.record(v.id, v.user_id, field, delta)
         return jsonify({"likes": v.likes, "dislikes": v.dislikes})
     except Exception as e:
         print(f"Erreur dans dislike_video(): {e}")
@@ -1548,12 +2422,17 @@ def dislike_video(video_id):
 @login_required
 def give_xp(video_id):
     try:
-        v = Video.query.get_or_404(video_id)
-        
+        v = video_cache.get(video_id)
+        if v is None:
+            return jsonify({"error": "Video introuvable"}), 404
+
         existing = Xp.query.filter_by(user_id=current_user.id, video_id=v.id).first()
         if not existing:
             db.session.add(Xp(user_id=current_user.id, video_id=v.id))
             db.session.commit()
+            trending.record(v.id, v.category, "xp")
+            stats.record(v.id, v.user_id, "xp")
+            runner.submit(suggestions.refresh_neighbours, v.id)
         
         return jsonify({"xp": v.xp})
     except Exception as e:
@@ -1567,7 +2446,8 @@ def give_xp(video_id):
 def show_profil(username):
     try:
         user = User.query.filter_by(display_name=username).first_or_404()
-        videos = Video.query.filter_by(user_id=user.id).order_by(Video.created_at.desc()).all()
+        # Premiere page seulement (projection legere) ; la suite via /api/users/<id>/videos
+        videos, next_cursor = profiles.user_videos(user.id)
 
         is_following = False
         if current_user.is_authenticated:
@@ -1576,7 +2456,9 @@ def show_profil(username):
                 followed_id=user.id
             ).first() is not None
 
-        body = render_template_string(PROFIL_BODY, user=user, videos=videos, is_following=is_following)
+        body = render_template_string(
+            PROFIL_BODY, user=user, videos=videos, next_cursor=next_cursor, is_following=is_following
+        )
         return render_template_string(BASE_HTML, body=body, year=datetime.utcnow().year, title=f"Profil de {user.display_name}")
     except Exception as e:
         print(f"Erreur dans show_profil(): {e}")
@@ -1595,15 +2477,27 @@ def follow_user(user_id):
         target_user = User.query.get_or_404(user_id)
         existing = Follow.query.filter_by(follower_id=current_user.id, followed_id=user_id).first()
         
+        # Compteurs mis a jour dans la meme transaction que le suivi
+        delta = -1 if existing else 1
         if existing:
             db.session.delete(existing)
             following = False
         else:
             db.session.add(Follow(follower_id=current_user.id, followed_id=user_id))
             following = True
-        
+        User.query.filter_by(id=user_id).update(
+            {User.followers_count: User.followers_count + delta}, synchronize_session=False
+        )
+        User.query.filter_by(id=current_user.id).update(
+            {User.following_count: User.following_count + delta}, synchronize_session=False
+        )
         db.session.commit()
-        return jsonify({"following": following})
+        # Solde net du jour : un desabonnement compense un abonnement
+        stats.record_follower(user_id, delta)
+        # Fil d'abonnements mis a jour en tache de fond
+        runner.submit(feed.backfill if following else feed.remove_creator, current_user.id, user_id)
+        followers_count = db.session.query(User.followers_count).filter_by(id=user_id).scalar()
+        return jsonify({"following": following, "followers_count": followers_count})
     except Exception as e:
         print(f"Erreur dans follow_user(): {e}")
         return jsonify({"error": str(e)}), 500
@@ -1686,11 +2580,72 @@ def init_database():
     """Initialise la base de donnees"""
     init_db()
 
+@app.cli.command("repair-follow-counts")
+def repair_follow_counts():
+    """Recalcule les compteurs d'abonnes / d'abonnements"""
+    print(f"✓ Compteurs corriges: {recount_follows()} utilisateurs")
+
+@app.cli.command("repair-video-counts")
+def repair_video_counts():
+    """Recalcule le nombre de videos de chaque utilisateur"""
+    print(f"✓ Compteurs corriges: {recount_videos()} utilisateurs")
+
+@app.cli.command("purge-orphans")
+@click.option("--delete", "delete", is_flag=True, help="Supprimer reellement (sinon simulation)")
+@click.option("--grace-hours", type=float, default=24, help="Ignorer les objets plus recents")
+@click.option("--report", "report_path", type=click.Path(), default=None, help="Rapport CSV des orphelins")
+@click.option("--local-only", is_flag=True, help="Ne pas parcourir le bucket Supabase")
+def purge_orphans_command(delete, grace_hours, report_path, local_only):
+    """Supprime les medias (bucket, uploads, hls) sans video associee"""
+    from janitor import purge_orphans
+    counts = purge_orphans(
+        UPLOAD_DIR, HLS_DIR, dry_run=not delete, grace_hours=grace_hours,
+        report_path=report_path, include_bucket=not local_only,
+    )
+    mode = "supprimes" if delete else "simulation"
+    print(f"✓ Orphelins ({mode}): {counts['orphans']} / {counts['scanned']} objets, "
+          f"{counts['bytes'] / 1_000_000:.1f} Mo")
+
+@app.cli.command("import-videos")
+@click.argument("source", type=click.Path(exists=True))
+@click.option("--workers", type=int, default=None, help="Processus paralleles (defaut: nb de CPU)")
+@click.option("--batch-size", type=int, default=50, help="Lignes Video inserees par commit")
+@click.option("--hls/--no-hls", default=True, help="Transcoder et publier en HLS")
+@click.option("--user-id", type=int, default=None, help="Proprietaire par defaut des videos")
+@click.option("--checkpoint", type=click.Path(), default=None, help="Fichier de reprise")
+@click.option("--skip-duration-check", is_flag=True, help="Ne pas appliquer la regle des 3 a 5 minutes")
+def import_videos(source, workers, batch_size, hls, user_id, checkpoint, skip_duration_check):
+    """Importe un dossier de videos ou un manifeste CSV/JSONL"""
+    from importer import run_import
+    counts = run_import(
+        source, workers=workers, batch_size=batch_size, to_hls=hls, user_id=user_id,
+        checkpoint_path=checkpoint, check_duration=not skip_duration_check,
+        valid_categories=CATEGORIES_MAP,
+    )
+    print(f"✓ Import termine: {counts}")
+
+@app.cli.command("backfill-stats")
+@click.option("--days", type=int, default=None, help="Limiter aux N derniers jours (defaut: tout)")
+def backfill_stats(days):
+    """Reconstruit les statistiques quotidiennes depuis likes, xp, comments et follows"""
+    counts = stats.backfill(days)
+    print(f"✓ Statistiques reconstruites: {counts}")
+
+@app.cli.command("build-recommendations")
+@click.option("--top-n", type=int, default=20, help="Voisins conserves par video")
+@click.option("--block-size", type=int, default=1024, help="Videos traitees par bloc")
+def build_recommendations_command(top_n, block_size):
+    """Calcule les recommandations par co-likes (likes + xp)"""
+    from recommendations import build_recommendations
+    summary = build_recommendations(top_n=top_n, block_size=block_size)
+    print(f"✓ Recommandations: {summary}")
+
 # -------------------------
 # Entree app
 # -------------------------
 if __name__ == "__main__":
     init_db()
+    start_background()
     port = int(os.environ.get("PORT", 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
 
@@ -0,0 +1,275 @@
+# importer.py
+"""Import en masse de videos depuis un dossier ou un manifeste (CSV / JSONL).
+
+Les etapes lourdes (ffprobe, miniatures, HLS, envoi Supabase) tournent dans
+un pool de processus, en deux etapes par fichier : analyse (ffprobe,
+empreinte) puis publication. Entre les deux, le processus principal cherche
+les doublons (cf. RunDuplicates) pour ne pas transcoder une video deja
+publiee. Les lignes Video sont inserees par lots depuis le processus
+principal, et un fichier de reprise (JSONL) permet de relancer un import
+interrompu sans retraiter les fichiers deja importes.
+"""
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from werkzeug.utils import secure_filename
+
+from extensions import db
+from models import User, Video
+
+VIDEO_EXTENSIONS = {".mp4", ".webm", ".ogg", ".mov", ".m4v"}
+CHECKPOINT_NAME = ".mitabo-import.jsonl"
+# Statuts definitifs : ces fichiers ne sont pas retraites a la reprise
+FINAL_STATUSES = {"done", "rejected"}
+
+
+def storage_name(path: str) -> str:
+    """Nom de stockage stable : meme fichier source -> meme cle (reprise idempotente)."""
+    base, ext = os.path.splitext(secure_filename(os.path.basename(path)) or "video.mp4")
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:10]
+    return f"{base}-{digest}{ext.lower()}"
+
+
+def iter_items(source: str):
+    """Produit des dicts {path, title, description, category, creator}."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS:
+                    yield {"path": os.path.join(root, name), "title": os.path.splitext(name)[0]}
+        return
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8", newline="") as f:
+        if source.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            row = {k: v for k, v in row.items() if v not in (None, "")}
+            row["path"] = os.path.join(base, row["path"])
+            row.setdefault("title", os.path.splitext(os.path.basename(row["path"]))[0])
+            yield row
+
+
+class Checkpoint:
+    """Journal JSONL des fichiers traites, relu au demarrage."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.status = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.status[entry["path"]] = entry["status"]
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def is_final(self, path: str) -> bool:
+        return self.status.get(path) in FINAL_STATUSES
+
+    def mark(self, path: str, status: str, **extra):
+        self.status[path] = status
+        self._fh.write(json.dumps({"path": path, "status": status, **extra}) + "\n")
+
+    def flush(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self):
+        self.flush()
+        self._fh.close()
+
+
+def analyse_item(item: dict, check_duration: bool):
+    """Etape 1, dans un processus du pool : ffprobe, regle de duree et
+    empreinte. Retourne ("rejected", message) ou ("analysed", (info, empreinte))."""
+    # Import tardif : le processus fils herite de l'app deja chargee
+    from home import probe_media, fingerprint_media
+
+    path = item["path"]
+    info = probe_media(path)
+    if check_duration and info is not None:
+        error = info.duration_error()
+        if error:
+            return "rejected", error
+    return "analysed", (info, fingerprint_media(path, info))
+
+
+def process_item(item: dict, info, fingerprint, to_hls: bool):
+    """Etape 2, dans un processus du pool : envoi, miniatures, storyboard et
+    HLS. Retourne (statut, champs Video ou message)."""
+    from home import process_media
+    from phash import to_signed
+
+    path = item["path"]
+    try:
+        fields = process_media(path, storage_name(path), "video/mp4", info, to_hls, upsert=True)
+    except Exception as e:
+        return "error", str(e)
+    fields["phash"] = to_signed(fingerprint) if fingerprint is not None else None
+    return "done", fields
+
+
+class RunDuplicates:
+    """Doublons detectes entre l'analyse et l'encodage, comme a l'upload :
+    contre les videos en base (index pHash) et contre les originaux deja
+    analyses par cet import (pas encore en base)."""
+
+    def __init__(self):
+        from phash import BKTree
+        self.tree = BKTree()
+        self.paths = []
+        self.inserted = {}        # chemin -> id de la Video inseree par cet import
+        self.late = {}            # id Video -> chemin d'un original insere apres elle
+
+    def check(self, item: dict, fingerprint) -> bool:
+        """Marque `item` (duplicate_of / duplicate_of_path) ; True si doublon."""
+        from phash import DUPLICATE_MAX_DISTANCE, is_informative, phash_index
+        if fingerprint is None or not is_informative(fingerprint):
+            return False
+        matches = phash_index.find_duplicates(fingerprint)
+        if matches:
+            item["duplicate_of"] = matches[0][1]
+            return True
+        local = self.tree.search(fingerprint, DUPLICATE_MAX_DISTANCE)
+        if local:
+            item["duplicate_of_path"] = self.paths[local[0][1]]
+            return True
+        self.tree.add(fingerprint, len(self.paths))
+        self.paths.append(item["path"])
+        return False
+
+    def resolve(self, item: dict):
+        """id de l'original, ou None s'il n'est pas (encore) en base."""
+        return item.get("duplicate_of") or self.inserted.get(item.get("duplicate_of_path"))
+
+    def link_late(self) -> int:
+        """Fin d'import : relie les doublons inseres avant leur original."""
+        linked = 0
+        for video_id, original in self.late.items():
+            original_id = self.inserted.get(original)
+            if original_id is not None:
+                Video.query.filter_by(id=video_id).update(
+                    {Video.duplicate_of: original_id}, synchronize_session=False
+                )
+                linked += 1
+        db.session.commit()
+        self.late.clear()
+        return linked
+
+
+def _flush(pending, checkpoint: Checkpoint, user_id, duplicates: RunDuplicates):
+    """Insere un lot de Video (en ignorant ceux deja en base, et en signalant
+    les doublons probables) puis journalise."""
+    names = [fields["filename"] for _, fields in pending]
+    existing = {
+        name for (name,) in db.session.query(Video.filename).filter(Video.filename.in_(names))
+    }
+    rows = []
+    for item, fields in pending:
+        if fields["filename"] in existing:
+            continue
+        rows.append((item, Video(
+            title=item.get("title", "Sans titre"),
+            description=item.get("description", ""),
+            category=item.get("category", "tendance"),
+            creator=item.get("creator", "Anonyme"),
+            user_id=int(item["user_id"]) if item.get("user_id") else user_id,
+            duplicate_of=duplicates.resolve(item),
+            **fields,
+        )))
+    db.session.add_all(row for _, row in rows)
+    db.session.flush()
+    for item, row in rows:
+        duplicates.inserted[item["path"]] = row.id
+        if row.duplicate_of is None and item.get("duplicate_of_path"):
+            duplicates.late[row.id] = item["duplicate_of_path"]
+    per_user = {}
+    for _, row in rows:
+        if row.user_id:
+            per_user[row.user_id] = per_user.get(row.user_id, 0) + 1
+    for owner_id, n in per_user.items():
+        User.query.filter_by(id=owner_id).update(
+            {User.videos_count: User.videos_count + n}, synchronize_session=False
+        )
+    db.session.commit()
+    for item, fields in pending:
+        checkpoint.mark(item["path"], "done", filename=fields["filename"])
+    checkpoint.flush()
+    pending.clear()
+    return len(rows)
+
+
+def run_import(source: str, workers: int = None, batch_size: int = 50, to_hls: bool = True,
+               user_id: int = None, checkpoint_path: str = None, check_duration: bool = True,
+               valid_categories=None) -> dict:
+    if checkpoint_path is None:
+        folder = source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source))
+        checkpoint_path = os.path.join(folder, CHECKPOINT_NAME)
+    checkpoint = Checkpoint(checkpoint_path)
+    workers = workers or os.cpu_count() or 2
+
+    counts = {"done": 0, "inserted": 0, "rejected": 0, "error": 0, "skipped": 0, "duplicates": 0}
+    pending = []
+    duplicates = RunDuplicates()
+    items = iter_items(source)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = {}
+
+        def submit_more():
+            # Fenetre bornee : le manifeste n'est jamais charge en entier
+            while len(running) < workers * 2:
+                item = next(items, None)
+                if item is None:
+                    return
+                if checkpoint.is_final(item["path"]):
+                    counts["skipped"] += 1
+                    continue
+                if valid_categories and item.get("category") not in valid_categories:
+                    item["category"] = "tendance"
+                running[pool.submit(analyse_item, item, check_duration)] = item
+
+        submit_more()
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item = running.pop(future)
+                try:
+                    status, result = future.result()
+                except Exception as e:
+                    status, result = "error", str(e)
+
+                if status == "analysed":
+                    # Doublon detecte avant l'encodage : publie sans HLS, comme a l'upload
+                    info, fingerprint = result
+                    is_duplicate = duplicates.check(item, fingerprint)
+                    if is_duplicate:
+                        counts["duplicates"] += 1
+                        print(f"⚠ {item['path']}: doublon probable, publie sans HLS")
+                    running[pool.submit(process_item, item, info, fingerprint,
+                                        to_hls and not is_duplicate)] = item
+                    continue
+
+                counts[status] += 1
+                if status == "done":
+                    pending.append((item, result))
+                else:
+                    print(f"⚠ {item['path']}: {status} - {result}")
+                    checkpoint.mark(item["path"], status, reason=result)
+
+                if len(pending) >= batch_size:
+                    counts["inserted"] += _flush(pending, checkpoint, user_id, duplicates)
+            submit_more()
+
+    if pending:
+        counts["inserted"] += _flush(pending, checkpoint, user_id, duplicates)
+    duplicates.link_late()
+    checkpoint.close()
+    return counts
@@ -0,0 +1,202 @@
+# janitor.py
+"""Reconciliation du stockage avec la table videos.
+
+Les objets references (une video = un `filename` et les dossiers derives de
+son nom : miniatures, storyboard, HLS) sont ecrits dans un index SQLite
+temporaire sur disque. Les listings du bucket, de UPLOAD_DIR et de HLS_DIR
+sont ensuite parcourus page par page et confrontes a l'index par lots : la
+memoire reste bornee meme avec des millions d'objets.
+"""
+import csv
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import storage
+from extensions import db
+from models import Video
+
+LOOKUP_BATCH = 500
+DELETE_BATCH = 100
+# Un upload en cours n'a pas encore sa ligne Video : on ne touche pas aux
+# objets recents.
+DEFAULT_GRACE_HOURS = 24
+# Prefixes du bucket dont le 2e segment est le nom de base de la video
+DERIVED_PREFIXES = ("thumbs", "storyboards", "hls")
+
+
+class ReferenceIndex:
+    """Ensemble de cles referencees, stocke dans un fichier SQLite."""
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="mitabo-refs-", suffix=".sqlite")
+        os.close(fd)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("CREATE TABLE refs (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE orphans (key TEXT PRIMARY KEY, size INTEGER) WITHOUT ROWID")
+
+    def add_many(self, keys):
+        self.conn.executemany("INSERT OR IGNORE INTO refs (key) VALUES (?)", ((k,) for k in keys))
+
+    def missing(self, keys):
+        """Retourne les cles de `keys` absentes de l'index."""
+        keys = list(set(keys))
+        found = set()
+        for i in range(0, len(keys), LOOKUP_BATCH):
+            chunk = keys[i:i + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(row[0] for row in self.conn.execute(
+                f"SELECT key FROM refs WHERE key IN ({placeholders})", chunk
+            ))
+        return set(keys) - found
+
+    def close(self):
+        self.conn.close()
+        os.remove(self.path)
+
+
+def build_index(chunk_size: int = 5000) -> ReferenceIndex:
+    """Parcourt la table videos en flux et indexe les cles referencees."""
+    index = ReferenceIndex()
+    query = db.session.query(Video.filename, Video.hls_manifest).execution_options(yield_per=chunk_size)
+    for filename, hls_manifest in query:
+        keys = []
+        if filename:
+            stem = os.path.splitext(filename)[0]
+            keys.append(f"videos/{filename}")
+            keys.append(f"local/{filename}")
+            keys.extend(f"{prefix}/{stem}" for prefix in DERIVED_PREFIXES)
+        if hls_manifest:
+            keys.append(f"hls/{hls_manifest.split('/')[0]}")
+        index.add_many(keys)
+    index.conn.commit()
+    return index
+
+
+def owner_key(key: str) -> str:
+    """Cle de rattachement d'un objet du bucket : le fichier video lui-meme,
+    ou le dossier `<prefixe>/<nom de base>` pour les fichiers derives."""
+    parts = key.split("/")
+    if parts[0] in DERIVED_PREFIXES and len(parts) > 2:
+        return f"{parts[0]}/{parts[1]}"
+    return key
+
+
+def _parse_ts(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class Report:
+    def __init__(self, path: str = None):
+        self.counts = {"scanned": 0, "orphans": 0, "bytes": 0, "deleted": 0}
+        self._fh = open(path, "w", encoding="utf-8", newline="") if path else None
+        self._csv = csv.writer(self._fh) if self._fh else None
+        if self._csv:
+            self._csv.writerow(["location", "key", "size", "deleted"])
+
+    def orphan(self, location: str, key: str, size: int, deleted: bool):
+        self.counts["orphans"] += 1
+        self.counts["bytes"] += size or 0
+        self.counts["deleted"] += int(deleted)
+        if self._csv:
+            self._csv.writerow([location, key, size, int(deleted)])
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reconcile_bucket(index: ReferenceIndex, report: Report, dry_run: bool, cutoff: float):
+    """Deux phases : les orphelins sont d'abord notes dans l'index (supprimer
+    pendant le listing decalerait la pagination par offset), puis supprimes
+    par lots en relisant la table."""
+    for page in _batched(storage.iter_objects(), LOOKUP_BATCH):
+        report.counts["scanned"] += len(page)
+        candidates = [
+            obj for obj in page
+            if (_parse_ts(obj.get("updated_at") or obj.get("created_at")) or 0) < cutoff
+        ]
+        missing = index.missing(owner_key(obj["key"]) for obj in candidates)
+        index.conn.executemany(
+            "INSERT OR IGNORE INTO orphans (key, size) VALUES (?, ?)",
+            (
+                (obj["key"], (obj.get("metadata") or {}).get("size", 0))
+                for obj in candidates if owner_key(obj["key"]) in missing
+            ),
+        )
+    index.conn.commit()
+
+    cursor = index.conn.execute("SELECT key, size FROM orphans ORDER BY key")
+    while True:
+        batch = cursor.fetchmany(DELETE_BATCH)
+        if not batch:
+            break
+        if not dry_run:
+            storage.remove(key for key, _ in batch)
+        for key, size in batch:
+            report.orphan("bucket", key, size, not dry_run)
+
+
+def reconcile_local(index: ReferenceIndex, report: Report, dry_run: bool, cutoff: float,
+                    upload_dir: str, hls_dir: str):
+    """UPLOAD_DIR : un fichier par video ; HLS_DIR : un dossier par video."""
+    def entries():
+        if os.path.isdir(upload_dir):
+            with os.scandir(upload_dir) as it:
+                for e in it:
+                    if e.is_file():
+                        yield "uploads", e.path, f"local/{e.name}"
+        if os.path.isdir(hls_dir):
+            with os.scandir(hls_dir) as it:
+                for e in it:
+                    if e.is_dir():
+                        yield "hls_dir", e.path, f"hls/{e.name}"
+
+    for page in _batched(entries(), LOOKUP_BATCH):
+        report.counts["scanned"] += len(page)
+        candidates = [p for p in page if os.path.getmtime(p[1]) < cutoff]
+        missing = index.missing(key for _, _, key in candidates)
+        for location, path, key in candidates:
+            if key not in missing:
+                continue
+            if os.path.isdir(path):
+                size = sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(path) for f in fs)
+                if not dry_run:
+                    shutil.rmtree(path, ignore_errors=True)
+            else:
+                size = os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+            report.orphan(location, path, size, not dry_run)
+
+
+def purge_orphans(upload_dir: str, hls_dir: str, dry_run: bool = True,
+                  grace_hours: float = DEFAULT_GRACE_HOURS, report_path: str = None,
+                  include_bucket: bool = True) -> dict:
+    cutoff = time.time() - grace_hours * 3600
+    index = build_index()
+    report = Report(report_path)
+    try:
+        reconcile_local(index, report, dry_run, cutoff, upload_dir, hls_dir)
+        if include_bucket:
+            reconcile_bucket(index, report, dry_run, cutoff)
+    finally:
+        report.close()
+        index.close()
+    return report.counts
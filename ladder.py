@@ -0,0 +1,210 @@
+# ladder.py
+"""Echelle de qualites HLS adaptee a chaque video.
+
+La source est analysee (resolution, bits par pixel) pour ne garder que les
+qualites utiles et ajuster le CRF, puis la playlist maitre est ecrite avec
+les debits mesures sur les segments produits.
+"""
+import os
+import re
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+
+@dataclass(frozen=True)
+class Rung:
+    height: int
+    width: int
+    crf: int
+    maxrate: int          # kbit/s, plafond VBV
+    audio_bitrate: int    # kbit/s
+    level: str            # niveau H.264 (hex) pour l'attribut CODECS
+    codec: Optional[str] = None   # CODECS video exact (source copiee telle quelle)
+
+
+DEFAULT_LADDER = [
+    Rung(240, 426, 27, 400, 64, "15"),
+    Rung(360, 640, 24, 800, 96, "1e"),
+    Rung(480, 854, 23, 1400, 128, "1e"),
+    Rung(720, 1280, 22, 2800, 128, "1f"),
+    Rung(1080, 1920, 21, 5000, 160, "28"),
+]
+
+AUDIO_ONLY_BITRATE = 64   # kbit/s, variante pour les connexions tres lentes
+AUDIO_CODEC = "mp4a.40.2"
+ENCODED_PROFILE = "4d40"  # Main (-profile:v main)
+
+# profile_idc + octet de contraintes du RFC 6381, par profil ffprobe
+H264_PROFILES = {
+    "Baseline": "4200",
+    "Constrained Baseline": "42e0",
+    "Main": "4d40",
+    "Extended": "5800",
+    "High": "6400",
+    "High 10": "6e00",
+    "High 4:2:2": "7a00",
+    "High 4:4:4 Predictive": "f400",
+}
+
+# Bits par pixel de la source : en dessous, contenu simple (ecran, dessin
+# anime) ; au dessus, contenu complexe (sport, grain).
+LOW_COMPLEXITY_BPP = 0.05
+HIGH_COMPLEXITY_BPP = 0.15
+
+
+def configured_ladder() -> List[Rung]:
+    """Hauteurs retenues via HLS_LADDER (ex: "240,360,720"), sinon toutes."""
+    raw = os.getenv("HLS_LADDER", "").strip()
+    if not raw:
+        return list(DEFAULT_LADDER)
+    heights = {int(h) for h in raw.split(",") if h.strip().isdigit()}
+    return [r for r in DEFAULT_LADDER if r.height in heights] or list(DEFAULT_LADDER)
+
+
+def source_bpp(info) -> Optional[float]:
+    if not (info and info.bitrate and info.width and info.height and info.fps):
+        return None
+    return info.bitrate / (info.width * info.height * info.fps)
+
+
+def source_codec(info) -> Optional[str]:
+    """CODECS video d'une source H.264 (profil et niveau lus par ffprobe)."""
+    profile = H264_PROFILES.get(info.video_profile or "")
+    if profile is None or info.video_level <= 0:
+        return None
+    return f"avc1.{profile}{info.video_level:02x}"
+
+
+def output_size(rung: Rung, info=None):
+    """Dimensions reelles d'une qualite : la boite du palier, tournee pour une
+    source portrait, reduite au format de la source et arrondie au pair
+    (meme calcul que le filtre scale ... force_original_aspect_ratio=decrease)."""
+    box_w, box_h = rung.width, rung.height
+    if not (info and info.width and info.height):
+        return box_w, box_h
+    if (info.height > info.width) != (box_h > box_w):
+        box_w, box_h = box_h, box_w
+    width = min(box_w, round(box_h * info.width / info.height))
+    height = min(box_h, round(box_w * info.height / info.width))
+    return width - width % 2, height - height % 2
+
+
+def select_ladder(info=None, ladder: List[Rung] = None) -> List[Rung]:
+    """Choisit les qualites a produire pour une source donnee.
+
+    - aucune qualite superieure a la resolution source (la plus basse est
+      toujours conservee) ;
+    - CRF et plafond ajustes selon la complexite estimee de la source.
+    """
+    rungs = list(ladder or configured_ladder())
+    if info is None or not info.height:
+        return [r for r in rungs if r.height <= 720] or rungs[:1]
+
+    short_side = min(info.width, info.height) if info.width else info.height
+    rungs = [r for r in rungs if r.height <= short_side] or rungs[:1]
+
+    bpp = source_bpp(info)
+    if bpp is not None and bpp < LOW_COMPLEXITY_BPP:
+        rungs = [replace(r, crf=r.crf + 2, maxrate=int(r.maxrate * 0.75)) for r in rungs]
+    elif bpp is not None and bpp > HIGH_COMPLEXITY_BPP:
+        rungs = [replace(r, crf=r.crf - 1) for r in rungs]
+    return rungs
+
+
+def ffmpeg_ladder_args(rungs: List[Rung], has_audio: bool = True, audio_only: bool = True,
+                       info=None) -> List[str]:
+    """Arguments ffmpeg (filtres, codecs, mapping, var_stream_map) pour l'echelle.
+
+    `has_audio` : seulement si ffprobe a vu une piste audio (sinon ffmpeg
+    echoue sur -map 0:a:0 et le var_stream_map qui la reference).
+    """
+    args = []
+    for i, r in enumerate(rungs):
+        if info and info.width and info.height:
+            width, height = output_size(r, info)
+            scale = f"scale=w={width}:h={height}"
+        else:
+            scale = f"scale=w={r.width}:h={r.height}:force_original_aspect_ratio=decrease:force_divisible_by=2"
+        args += [
+            f"-filter:v:{i}", scale,
+            f"-c:v:{i}", "h264", f"-profile:v:{i}", "main", f"-crf:{i}", str(r.crf),
+            f"-maxrate:v:{i}", f"{r.maxrate}k", f"-bufsize:v:{i}", f"{r.maxrate * 2}k",
+        ]
+    args += ["-sc_threshold", "0", "-g", "48", "-keyint_min", "48"]
+
+    for _ in rungs:
+        args += ["-map", "0:v:0"]
+    stream_map = [f"v:{i}" for i in range(len(rungs))]
+
+    if has_audio:
+        audio_rates = [r.audio_bitrate for r in rungs]
+        if audio_only:
+            audio_rates.append(AUDIO_ONLY_BITRATE)
+        for i, rate in enumerate(audio_rates):
+            args += ["-map", "0:a:0", f"-c:a:{i}", "aac", f"-b:a:{i}", f"{rate}k", f"-ar:{i}", "48000"]
+        stream_map = [f"v:{i},a:{i}" for i in range(len(rungs))]
+        if audio_only:
+            stream_map.append(f"a:{len(rungs)}")
+
+    args += ["-var_stream_map", " ".join(stream_map)]
+    return args
+
+
+_EXTINF = re.compile(r"#EXTINF:([\d.]+)")
+_BYTERANGE = re.compile(r"#EXT-X-BYTERANGE:(\d+)")
+
+
+def measure_playlist(playlist_path: str):
+    """Retourne (debit crete, debit moyen) en bit/s d'une playlist media."""
+    base = os.path.dirname(playlist_path)
+    peak, total_bits, total_duration = 0.0, 0, 0.0
+    duration, size = None, None
+    with open(playlist_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            m = _EXTINF.match(line)
+            if m:
+                duration = float(m.group(1))
+                continue
+            m = _BYTERANGE.match(line)
+            if m:
+                size = int(m.group(1))
+                continue
+            if line and not line.startswith("#") and duration:
+                if size is None:
+                    size = os.path.getsize(os.path.join(base, line))
+                bits = size * 8
+                peak = max(peak, bits / duration)
+                total_bits += bits
+                total_duration += duration
+                duration, size = None, None
+    average = total_bits / total_duration if total_duration else 0.0
+    return int(peak), int(average)
+
+
+def write_master_playlist(target_dir: str, variants, has_audio: bool = True,
+                          name: str = "master.m3u8", version: int = 3, info=None) -> str:
+    """Ecrit la playlist maitre avec BANDWIDTH / AVERAGE-BANDWIDTH mesures.
+
+    `variants` : liste de (sous_dossier, Rung ou None pour l'audio seul).
+    RESOLUTION est calculee sur les dimensions de la source (`info`).
+    """
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{version}", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for subdir, rung in variants:
+        peak, average = measure_playlist(os.path.join(target_dir, subdir, "index.m3u8"))
+        if rung is None:
+            attrs = f'BANDWIDTH={peak},AVERAGE-BANDWIDTH={average},CODECS="{AUDIO_CODEC}"'
+        else:
+            video_codec = rung.codec or f"avc1.{ENCODED_PROFILE}{rung.level}"
+            codecs = f"{video_codec},{AUDIO_CODEC}" if has_audio else video_codec
+            width, height = output_size(rung, info)
+            attrs = (
+                f"BANDWIDTH={peak},AVERAGE-BANDWIDTH={average},"
+                f'RESOLUTION={width}x{height},CODECS="{codecs}"'
+            )
+        lines += [f"#EXT-X-STREAM-INF:{attrs}", f"{subdir}/index.m3u8"]
+
+    path = os.path.join(target_dir, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
@@ -1,4 +1,5 @@
 # models.py
+from collections import namedtuple
 from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -15,6 +16,10 @@ class User(UserMixin, db.Model):
     avatar_url = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
+    # Compteurs denormalises, tenus a jour par follow_user() (voir recount_follows)
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    videos_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     
     # Relations
     videos = db.relationship('Video', backref='user', lazy=True)
@@ -48,19 +53,60 @@ class User(UserMixin, db.Model):
             follower_id=self.id, 
             followed_id=user.id
         ).first() is not None
-    
+
+
+def resolve_source_url(hls_url, external_url, hls_manifest, filename) -> str:
+    # Priorité 0 : HLS publié sur Supabase (adaptatif et permanent)
+    if hls_url:
+        return hls_url
+    # Priorité 1 : URL externe (Supabase - permanent)
+    if external_url:
+        return external_url
+    # Priorité 2 : HLS (si disponible)
+    if hls_manifest:
+        return url_for("hls", filename=hls_manifest, _external=False)
+    # Priorité 3 : Fichier local (fallback, mais sera supprimé sur Render)
+    if filename:
+        return url_for("media", filename=filename, _external=False)
+    return ""
+
+
+class VideoDisplayMixin:
+    """Proprietes d'affichage communes a Video, VideoCard et VideoSnapshot (sans SQL)."""
+    __slots__ = ()
+
     @property
-    def followers_count(self):
-        """Nombre d'abonnés"""
-        return self.followers.count()
-    
+    def source_url(self):
+        """Retourne l'URL de la vidéo avec priorité à Supabase"""
+        return resolve_source_url(self.hls_url, self.external_url, self.hls_manifest, self.filename)
+
     @property
-    def following_count(self):
-        """Nombre d'abonnements"""
-        return self.following.count()
+    def is_hls(self) -> bool:
+        return bool(self.hls_url or self.hls_manifest)
+
+
+class VideoCountsMixin(VideoDisplayMixin):
+    """Compteurs de la page video (une requete chacun) : Video et VideoSnapshot
+    seulement, jamais les cartes des listes (une requete par ligne)."""
+    __slots__ = ()
+
+    @property
+    def likes(self):
+        """Compte les likes depuis la table Like"""
+        return Like.query.filter_by(video_id=self.id, is_like=True).count()
+
+    @property
+    def dislikes(self):
+        """Compte les dislikes depuis la table Like"""
+        return Like.query.filter_by(video_id=self.id, is_like=False).count()
+
+    @property
+    def xp(self):
+        """Compte les XP depuis la table Xp"""
+        return Xp.query.filter_by(video_id=self.id).count()
 
 
-class Video(db.Model):
+class Video(VideoCountsMixin, db.Model):
     __tablename__ = "videos"
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -69,46 +115,96 @@ class Video(db.Model):
     filename = db.Column(db.String(255), nullable=True)
     external_url = db.Column(db.String(500), nullable=True)
     thumb_url = db.Column(db.String(500), nullable=True)
+    thumb_srcset = db.Column(db.Text, nullable=True)
+    storyboard_url = db.Column(db.String(500), nullable=True)
     duration = db.Column(db.String(20), default="")
+    duration_seconds = db.Column(db.Float, nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    video_codec = db.Column(db.String(32), nullable=True)
+    audio_codec = db.Column(db.String(32), nullable=True)
+    bitrate = db.Column(db.Integer, nullable=True)
+    phash = db.Column(db.BigInteger, nullable=True)
+    duplicate_of = db.Column(db.Integer, db.ForeignKey("videos.id"), nullable=True)
     creator = db.Column(db.String(80), default="Anonyme")
     views = db.Column(db.Integer, default=0)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     hls_manifest = db.Column(db.String(500), nullable=True)
+    hls_url = db.Column(db.String(500), nullable=True)
+    viewers_hll = db.deferred(db.Column(db.LargeBinary, nullable=True))   # sketch HyperLogLog cumule (zlib)
+    unique_viewers = db.Column(db.Integer, nullable=True)
     
     # Relations
     comments = db.relationship('Comment', backref='video', lazy=True)
     like_records = db.relationship('Like', backref='video', lazy=True)
     xp_records = db.relationship('Xp', backref='video', lazy=True)
 
-    @property
-    def source_url(self):
-        """Retourne l'URL de la vidéo avec priorité à Supabase"""
-        # Priorité 1 : URL externe (Supabase - permanent)
-        if self.external_url:
-            return self.external_url
-        # Priorité 2 : HLS (si disponible)
-        if self.hls_manifest:
-            return url_for("hls", filename=self.hls_manifest, _external=False)
-        # Priorité 3 : Fichier local (fallback, mais sera supprimé sur Render)
-        if self.filename:
-            return url_for("media", filename=self.filename, _external=False)
-        return ""
-    
-    @property
-    def likes(self):
-        """Compte les likes depuis la table Like"""
-        return Like.query.filter_by(video_id=self.id, is_like=True).count()
-    
-    @property
-    def dislikes(self):
-        """Compte les dislikes depuis la table Like"""
-        return Like.query.filter_by(video_id=self.id, is_like=False).count()
+    # Pagination par curseur des videos d'un createur
+    __table_args__ = (db.Index("ix_videos_user_created", "user_id", "created_at", "id"),)
+
+
+# -------------------------
+# Projection legere pour les grilles et listes
+# -------------------------
+CARD_COLUMNS = (
+    "id", "title", "creator", "category", "views", "unique_viewers", "thumb_url", "thumb_srcset",
+    "created_at", "user_id", "hls_url", "external_url", "hls_manifest", "filename",
+)
+
+
+class VideoCard(namedtuple("VideoCard", CARD_COLUMNS), VideoDisplayMixin):
+    """Carte video en lecture seule : colonnes d'affichage uniquement, sans
+    description, sans instance ORM ni suivi par la session."""
+    __slots__ = ()
+
+
+def card_columns() -> list:
+    return [getattr(Video, name) for name in CARD_COLUMNS]
 
-    @property
-    def xp(self):
-        """Compte les XP depuis la table Xp"""
-        return Xp.query.filter_by(video_id=self.id).count()
+
+def card_select():
+    """SELECT des colonnes d'une carte, a completer (where, order_by, limit)."""
+    return db.select(*card_columns())
+
+
+def load_cards(stmt) -> list:
+    return [VideoCard._make(row) for row in db.session.execute(stmt)]
+
+
+def cards_by_ids(ids) -> list:
+    """Multi-get de cartes, dans l'ordre de `ids` (ids absents ignores)."""
+    if not ids:
+        return []
+    by_id = {card.id: card for card in load_cards(card_select().where(Video.id.in_(ids)))}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+# Instantane complet (toutes les colonnes sauf le sketch HLL), pour le cache
+SNAPSHOT_COLUMNS = tuple(c.key for c in Video.__table__.columns if c.key != "viewers_hll")
+# Compteurs ecrits a chaque vue : ils n'invalident pas le cache (bornes par le TTL)
+COUNTER_COLUMNS = ("views", "unique_viewers", "viewers_hll")
+
+
+class VideoSnapshot(namedtuple("VideoSnapshot", SNAPSHOT_COLUMNS), VideoCountsMixin):
+    """Ligne Video figee, partageable entre requetes et threads."""
+    __slots__ = ()
+
+
+def load_snapshots(ids) -> dict:
+    if not ids:
+        return {}
+    stmt = db.select(*(getattr(Video, name) for name in SNAPSHOT_COLUMNS)).where(Video.id.in_(ids))
+    return {row.id: VideoSnapshot._make(row) for row in db.session.execute(stmt)}
+
+
+class VideoInvalidation(db.Model):
+    """Journal des modifications de videos : son id sert de compteur de version
+    global, relu par chaque worker pour purger son cache."""
+    __tablename__ = "video_invalidations"
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 
 class Comment(db.Model):
@@ -138,7 +234,9 @@ class Follow(db.Model):
     followed_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('follower_id', 'followed_id'),)
+    __table_args__ = (db.UniqueConstraint('follower_id', 'followed_id'),
+                      db.Index("ix_follows_followed_created", "followed_id", "created_at", "id"),
+                      db.Index("ix_follows_follower_created", "follower_id", "created_at", "id"))
 
 
 class Xp(db.Model):
@@ -149,3 +247,194 @@ class Xp(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     __table_args__ = (db.UniqueConstraint('user_id', 'video_id', name="unique_user_xp"),)
+
+
+
+class TrendingScore(db.Model):
+    """Score de tendance (logarithme, decroissance vers l'avant) par video"""
+    __tablename__ = "trending_scores"
+    video_id = db.Column(db.Integer, db.ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    category = db.Column(db.String(40), nullable=False)
+    log_score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.Index("ix_trending_category_score", "category", "log_score"),
+                      db.Index("ix_trending_score", "log_score"))
+
+
+
+class VideoSuggestion(db.Model):
+    """Suggestions precalculees : ids classes, separes par des virgules"""
+    __tablename__ = "video_suggestions"
+    video_id = db.Column(db.Integer, db.ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    suggested_ids = db.Column(db.Text, nullable=False, default="")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+
+class VideoRecommendation(db.Model):
+    """Voisins par co-likes (cosinus), calcules hors ligne : ids classes, separes par des virgules"""
+    __tablename__ = "video_recommendations"
+    video_id = db.Column(db.Integer, db.ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    recommended_ids = db.Column(db.Text, nullable=False, default="")
+    scores = db.Column(db.Text, nullable=False, default="")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+
+class TimelineEntry(db.Model):
+    """Fil d'abonnements materialise : une ligne par (abonne, video)"""
+    __tablename__ = "timelines"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)  # date de la video (cle de pagination)
+
+    __table_args__ = (db.Index("ix_timelines_user_created", "user_id", "created_at", "video_id"),)
+
+
+
+class VideoViewers(db.Model):
+    """Sketch HyperLogLog journalier des spectateurs d'une video"""
+    __tablename__ = "video_viewers"
+    video_id = db.Column(db.Integer, db.ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)
+
+
+
+class WatchTimeHourly(db.Model):
+    """Temps de visionnage agrege par video et par heure (battements de lecture)"""
+    __tablename__ = "watch_time_hourly"
+    video_id = db.Column(db.Integer, db.ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)
+    watch_seconds = db.Column(db.Float, nullable=False, default=0)
+    heartbeats = db.Column(db.Integer, nullable=False, default=0)
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    completions = db.Column(db.Integer, nullable=False, default=0)
+
+
+
+class VideoDailyStats(db.Model):
+    """Compteurs quotidiens d'une video (increments nets)"""
+    __tablename__ = "video_daily_stats"
+    video_id = db.Column(db.Integer, db.ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    dislikes = db.Column(db.Integer, nullable=False, default=0)
+    xp = db.Column(db.Integer, nullable=False, default=0)
+    comments = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CreatorDailyStats(db.Model):
+    """Compteurs quotidiens d'un createur (somme de ses videos + nouveaux abonnes)"""
+    __tablename__ = "creator_daily_stats"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    dislikes = db.Column(db.Integer, nullable=False, default=0)
+    xp = db.Column(db.Integer, nullable=False, default=0)
+    comments = db.Column(db.Integer, nullable=False, default=0)
+    new_followers = db.Column(db.Integer, nullable=False, default=0)   # solde net du jour
+
+
+def add_missing_columns():
+    """Ajoute les colonnes declarees dans les modeles mais absentes en base.
+
+    `db.create_all()` ne modifie pas les tables existantes : on complete
+    donc le schema colonne par colonne (colonnes nullables, ou avec une
+    valeur par defaut serveur). Retourne les colonnes ajoutees ("table.colonne").
+    """
+    added = []
+    # Inspection complete avant le premier ALTER : la session garde ensuite
+    # la connexion, et le pool n'en a qu'une
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    present = {
+        table.name: {c["name"] for c in inspector.get_columns(table.name)}
+        for table in db.metadata.sorted_tables if table.name in existing_tables
+    }
+    for table in db.metadata.sorted_tables:
+        if table.name not in present:
+            continue
+        for column in table.columns:
+            if column.name in present[table.name]:
+                continue
+            col_type = column.type.compile(dialect=db.engine.dialect)
+            if column.server_default is not None:
+                col_type += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    col_type += " NOT NULL"
+            db.session.execute(db.text(
+                f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'
+            ))
+            added.append(f"{table.name}.{column.name}")
+            print(f"✓ Colonne ajoutee: {table.name}.{column.name}")
+    db.session.commit()
+    return added
+
+
+def add_missing_indexes():
+    """Cree les index declares dans les modeles mais absents des tables existantes."""
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in present:
+                continue
+            try:
+                index.create(bind=db.engine)
+                print(f"✓ Index ajoute: {index.name}")
+            except Exception as e:
+                print(f"⚠ Index non cree {index.name}: {e}")
+
+
+def recount_videos() -> int:
+    """Recalcule users.videos_count ; retourne le nombre de compteurs corriges."""
+    counts = dict(
+        db.session.query(Video.user_id, db.func.count(Video.id))
+        .filter(Video.user_id.isnot(None))
+        .group_by(Video.user_id)
+    )
+    fixes = [
+        {"id": user_id, "videos_count": counts.get(user_id, 0)}
+        for user_id, stored in db.session.query(User.id, User.videos_count)
+        if stored != counts.get(user_id, 0)
+    ]
+    if fixes:
+        db.session.execute(db.update(User), fixes)
+    db.session.commit()
+    return len(fixes)
+
+
+def recount_follows() -> int:
+    """Recalcule followers_count / following_count en une requete groupee.
+
+    Retourne le nombre d'utilisateurs dont les compteurs etaient faux.
+    """
+    edges = db.union_all(
+        db.select(Follow.followed_id.label("user_id"), db.literal(1).label("followers"),
+                  db.literal(0).label("following")),
+        db.select(Follow.follower_id, db.literal(0), db.literal(1)),
+    ).subquery()
+    counts = {
+        user_id: (int(followers), int(following))
+        for user_id, followers, following in db.session.query(
+            edges.c.user_id, db.func.sum(edges.c.followers), db.func.sum(edges.c.following)
+        ).group_by(edges.c.user_id)
+    }
+    fixes = [
+        {"id": user_id, "followers_count": counts.get(user_id, (0, 0))[0],
+         "following_count": counts.get(user_id, (0, 0))[1]}
+        for user_id, followers, following in db.session.query(
+            User.id, User.followers_count, User.following_count
+        )
+        if (followers, following) != counts.get(user_id, (0, 0))
+    ]
+    if fixes:
+        db.session.execute(db.update(User), fixes)
+    db.session.commit()
+    return len(fixes)
@@ -0,0 +1,167 @@
+# phash.py
+"""Empreinte perceptuelle des videos et detection des re-uploads.
+
+Chaque video recoit un hash de 64 bits : dHash (Pillow) de quelques images
+echantillonnees, combines par vote majoritaire bit a bit. Un re-encodage
+(autre debit, autre resolution) change tres peu de bits, d'ou une
+recherche par distance de Hamming dans un BK-tree.
+
+Une image unie (ecran noir, fondu) donne un hash presque constant (tous les
+bits a 0 ou a 1) : toutes ces videos seraient "proches" entre elles. Ces
+hash ne sont ni indexes ni recherches (cf. is_informative).
+"""
+import subprocess
+import threading
+
+from PIL import Image
+
+SAMPLE_FRAMES = 9
+FRAME_WIDTH, FRAME_HEIGHT = 64, 36
+DUPLICATE_MAX_DISTANCE = 6
+MIN_INFORMATIVE_BITS = 8      # bits a 1 (et a 0) minimum d'un hash exploitable
+
+
+def dhash(img: Image.Image) -> int:
+    """Difference hash 64 bits : compare chaque pixel a son voisin de droite."""
+    small = img.convert("L").resize((9, 8), Image.LANCZOS)
+    px = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = px[row * 9 + col]
+            right = px[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def sample_frames(input_path: str, duration: float, count: int = SAMPLE_FRAMES):
+    """Extrait `count` images reparties sur la video, en une passe ffmpeg."""
+    if duration and duration > 0:
+        vf = f"fps={count}/{duration:.3f},scale={FRAME_WIDTH}:{FRAME_HEIGHT}"
+    else:
+        vf = f"fps=1,scale={FRAME_WIDTH}:{FRAME_HEIGHT}"
+    cmd = [
+        "ffmpeg", "-v", "error", "-i", input_path, "-an", "-vf", vf,
+        "-frames:v", str(count), "-f", "rawvideo", "-pix_fmt", "gray", "-",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    size = FRAME_WIDTH * FRAME_HEIGHT
+    raw = proc.stdout
+    return [
+        Image.frombytes("L", (FRAME_WIDTH, FRAME_HEIGHT), raw[i:i + size])
+        for i in range(0, len(raw) - size + 1, size)
+    ]
+
+
+def combine(hashes) -> int:
+    """Vote majoritaire bit a bit des hash d'images."""
+    value = 0
+    for bit in range(63, -1, -1):
+        ones = sum((h >> bit) & 1 for h in hashes)
+        value = (value << 1) | (ones * 2 > len(hashes))
+    return value
+
+
+def video_phash(input_path: str, duration: float = 0.0):
+    frames = sample_frames(input_path, duration)
+    if not frames:
+        return None
+    return combine(dhash(f) for f in frames) if len(frames) > 1 else dhash(frames[0])
+
+
+def to_signed(value: int) -> int:
+    """Conversion pour une colonne BIGINT (signee)."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def is_informative(value: int) -> bool:
+    """Faux pour un hash quasi constant (image unie, noire ou blanche)."""
+    ones = bin(value).count("1")
+    return MIN_INFORMATIVE_BITS <= ones <= 64 - MIN_INFORMATIVE_BITS
+
+
+class BKTree:
+    """Arbre de Burkhard-Keller sur la distance de Hamming.
+
+    Noeud : [hash, ids, {distance: enfant}]. L'inegalite triangulaire permet
+    de n'explorer que les enfants a distance [d - r, d + r] du noeud.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item_id: int):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item_id], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item_id], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int):
+        """Retourne [(distance, id)] tries par distance croissante."""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                results.extend((d, item_id) for item_id in node[1])
+            for dist, child in node[2].items():
+                if d - radius <= dist <= d + radius:
+                    stack.append(child)
+        results.sort()
+        return results
+
+
+class PhashIndex:
+    """BK-tree par worker, complete a chaque recherche avec les videos
+    ajoutees depuis (y compris par les autres workers) : une seule requete
+    `id > dernier id charge`."""
+
+    def __init__(self):
+        self.tree = BKTree()
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        from models import Video
+        rows = (
+            Video.query.with_entities(Video.id, Video.phash)
+            .filter(Video.id > self.last_id, Video.phash.isnot(None))
+            .order_by(Video.id)
+            .yield_per(5000)
+        )
+        for video_id, value in rows:
+            value = to_unsigned(value)
+            if is_informative(value):
+                self.tree.add(value, video_id)
+            self.last_id = video_id
+
+    def find_duplicates(self, value: int, radius: int = DUPLICATE_MAX_DISTANCE):
+        if not is_informative(value):
+            return []
+        with self._lock:
+            self._refresh()
+            return self.tree.search(value, radius)
+
+
+phash_index = PhashIndex()
@@ -0,0 +1,116 @@
+# probe.py
+"""Lecture des metadonnees d'une video avec ffprobe (en-tete du conteneur
+uniquement, aucun decodage)."""
+import json
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Optional
+
+# Article 2 du reglement : duree comprise entre 3 et 5 minutes
+MIN_DURATION = 3 * 60
+MAX_DURATION = 5 * 60
+
+# Au-dela, la source est reencodee meme si les codecs sont compatibles
+PASSTHROUGH_MAX_HEIGHT = 1080
+PASSTHROUGH_MAX_BITRATE = 8_000_000
+
+
+@dataclass
+class MediaInfo:
+    duration: float = 0.0
+    width: int = 0
+    height: int = 0
+    video_codec: Optional[str] = None
+    video_profile: Optional[str] = None   # ex: "High", "Constrained Baseline"
+    video_level: int = 0                  # niveau H.264 x10 (ex: 40 pour 4.0)
+    audio_codec: Optional[str] = None
+    bitrate: int = 0
+    fps: float = 0.0
+    container: Optional[str] = None
+
+    @property
+    def duration_label(self) -> str:
+        total = int(round(self.duration))
+        h, rest = divmod(total, 3600)
+        m, s = divmod(rest, 60)
+        return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
+
+    def duration_error(self) -> Optional[str]:
+        """Message d'erreur si la duree ne respecte pas le reglement ; aucun
+        si ffprobe n'a pas pu la lire (conteneur sans duree)."""
+        if not self.duration:
+            return None
+        if self.duration < MIN_DURATION or self.duration > MAX_DURATION:
+            return (
+                f"La video dure {self.duration_label} : le reglement impose "
+                f"une duree comprise entre 3 et 5 minutes"
+            )
+        return None
+
+    @property
+    def can_passthrough(self) -> bool:
+        """Vrai si la source peut etre segmentee en HLS sans reencodage."""
+        return (
+            self.video_codec == "h264"
+            and self.audio_codec in ("aac", None)
+            and 0 < self.height <= PASSTHROUGH_MAX_HEIGHT
+            and 0 < self.bitrate <= PASSTHROUGH_MAX_BITRATE
+        )
+
+
+def ffprobe_exists() -> bool:
+    return shutil.which("ffprobe") is not None
+
+
+def _parse_rate(rate: str) -> float:
+    try:
+        num, _, den = (rate or "0/1").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _rotation(video: dict) -> int:
+    """Rotation d'affichage en degres (telephones : video codee en paysage)."""
+    for side in video.get("side_data_list") or []:
+        if "rotation" in side:
+            return int(side["rotation"])
+    try:
+        return int((video.get("tags") or {}).get("rotate") or 0)
+    except ValueError:
+        return 0
+
+
+def parse_ffprobe(data: dict) -> MediaInfo:
+    fmt = data.get("format", {})
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+
+    width, height = int(video.get("width") or 0), int(video.get("height") or 0)
+    # Dimensions affichees : ffmpeg applique la rotation au decodage
+    if _rotation(video) % 180:
+        width, height = height, width
+
+    return MediaInfo(
+        duration=float(fmt.get("duration") or video.get("duration") or 0),
+        width=width,
+        height=height,
+        video_codec=video.get("codec_name"),
+        video_profile=video.get("profile"),
+        video_level=int(video.get("level") or 0),
+        audio_codec=audio.get("codec_name"),
+        bitrate=int(fmt.get("bit_rate") or 0),
+        fps=_parse_rate(video.get("avg_frame_rate")),
+        container=fmt.get("format_name"),
+    )
+
+
+def probe(input_path: str) -> MediaInfo:
+    cmd = [
+        "ffprobe", "-v", "error", "-print_format", "json",
+        "-show_format", "-show_streams", input_path,
+    ]
+    proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return parse_ffprobe(json.loads(proc.stdout or b"{}"))
@@ -0,0 +1,59 @@
+# profiles.py
+"""Listes paginees d'un profil : videos, abonnes, abonnements.
+
+Pagination par curseur (created_at, id) sur des index composes, sans
+OFFSET ni chargement du catalogue complet ; les requetes ne lisent que
+les colonnes affichees.
+"""
+from extensions import db
+from feed import encode_cursor, decode_cursor
+
+PAGE_SIZE = 12
+
+
+def _page(query, created_col, id_col, cursor: str, limit: int):
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        query = query.filter(db.tuple_(created_col, id_col) < after)
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].cursor_at, rows[-1].cursor_id) if more else None
+    return rows, next_cursor
+
+
+def user_videos(user_id: int, cursor: str = None, limit: int = PAGE_SIZE):
+    """Videos d'un createur, des plus recentes aux plus anciennes : (cartes, curseur)."""
+    from models import CARD_COLUMNS, Video, VideoCard, card_columns
+    query = db.session.query(
+        *card_columns(), Video.created_at.label("cursor_at"), Video.id.label("cursor_id"),
+    ).filter(Video.user_id == user_id, Video.created_at.isnot(None))
+    rows, next_cursor = _page(query, Video.created_at, Video.id, cursor, limit)
+    return [VideoCard._make(row[:len(CARD_COLUMNS)]) for row in rows], next_cursor
+
+
+def _follow_list(user_id: int, followers: bool, cursor: str, limit: int):
+    from models import Follow, User
+    mine, other = (
+        (Follow.followed_id, Follow.follower_id) if followers
+        else (Follow.follower_id, Follow.followed_id)
+    )
+    query = (
+        db.session.query(
+            User.id, User.display_name, User.avatar_url, User.followers_count,
+            Follow.created_at.label("cursor_at"), Follow.id.label("cursor_id"),
+        )
+        .join(User, User.id == other)
+        .filter(mine == user_id, Follow.created_at.isnot(None))
+    )
+    return _page(query, Follow.created_at, Follow.id, cursor, limit)
+
+
+def followers(user_id: int, cursor: str = None, limit: int = PAGE_SIZE):
+    """Abonnes, du plus recent au plus ancien : (lignes, curseur)."""
+    return _follow_list(user_id, True, cursor, limit)
+
+
+def following(user_id: int, cursor: str = None, limit: int = PAGE_SIZE):
+    """Comptes suivis, du plus recent au plus ancien : (lignes, curseur)."""
+    return _follow_list(user_id, False, cursor, limit)
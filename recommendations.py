@@ -0,0 +1,181 @@
+# recommendations.py
+"""Recommandations "ceux qui ont aime ceci ont aussi aime" (co-likes).
+
+Job hors ligne (`flask build-recommendations`) : matrice creuse
+utilisateurs x videos construite depuis likes (is_like) et xp, colonnes
+normalisees L2 ; la similarite cosinus entre videos vaut alors X^T X.
+Cette matrice n'est jamais materialisee : on la calcule par blocs de
+videos (X[:, bloc]^T X), on garde le top-N de chaque ligne de facon
+vectorisee, et on ecrit le bloc en base avant de passer au suivant. La
+memoire est bornee par la taille d'un bloc, pas par le nombre de paires.
+
+Les resultats sont lus par les suggestions de la page watch et par
+/api/videos/<id>/recommendations.
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+import scipy.sparse as sp
+
+from extensions import db
+
+TOP_N = 20
+BLOCK_SIZE = 1024
+FETCH_SIZE = 50_000
+LIKE_WEIGHT = 1.0
+XP_WEIGHT = 2.0
+# Une video aimee par un seul utilisateur donnerait des cosinus de 1 sans signification
+MIN_SUPPORT = 2
+# Le cout de X^T X croit comme la somme des carres des activites : au-dela,
+# on echantillonne les interactions de l'utilisateur (tirage deterministe)
+MAX_USER_ITEMS = 500
+# Similarites plus faibles ignorees avant le tri (bruit)
+MIN_SCORE = 0.01
+
+
+def load_interactions(fetch_size: int = FETCH_SIZE):
+    """Lit (user_id, video_id, poids) depuis likes et xp, par paquets numpy."""
+    from models import Like, Xp
+    users, videos, weights = [], [], []
+    sources = (
+        (db.select(Like.user_id, Like.video_id).where(Like.is_like.is_(True)), LIKE_WEIGHT),
+        (db.select(Xp.user_id, Xp.video_id), XP_WEIGHT),
+    )
+    for stmt, weight in sources:
+        result = db.session.execute(stmt.execution_options(yield_per=fetch_size))
+        for part in result.partitions():
+            pairs = np.asarray(part, dtype=np.int64).reshape(-1, 2)
+            users.append(pairs[:, 0])
+            videos.append(pairs[:, 1])
+            weights.append(np.full(len(pairs), weight, dtype=np.float32))
+    if not users:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    return np.concatenate(users), np.concatenate(videos), np.concatenate(weights)
+
+
+def cap_users(users, videos, weights, max_items: int = MAX_USER_ITEMS, seed: int = 0):
+    """Garde au plus `max_items` interactions par utilisateur."""
+    counts = np.bincount(np.unique(users, return_inverse=True)[1])
+    if not len(counts) or counts.max() <= max_items:
+        return users, videos, weights
+    keys = np.random.default_rng(seed).random(len(users))
+    order = np.lexsort((keys, users))
+    sorted_users = users[order]
+    first = np.searchsorted(sorted_users, sorted_users, side="left")
+    keep = order[(np.arange(len(order)) - first) < max_items]
+    return users[keep], videos[keep], weights[keep]
+
+
+def build_matrix(users, videos, weights, min_support: int = MIN_SUPPORT,
+                 max_user_items: int = MAX_USER_ITEMS):
+    """Matrice CSR utilisateurs x videos, colonnes de norme 1.
+
+    Retourne (X, video_ids) ou video_ids[j] est l'id de la colonne j. Un like
+    et un xp du meme utilisateur sur la meme video s'additionnent. Le poids
+    de chaque utilisateur est amorti par log2(1 + activite) pour que les
+    comptes qui aiment tout ne dominent pas les similarites.
+    """
+    users, videos, weights = cap_users(users, videos, weights, max_user_items)
+    video_ids, col = np.unique(videos, return_inverse=True)
+    _, row = np.unique(users, return_inverse=True)
+    shape = (int(row.max()) + 1 if len(row) else 0, len(video_ids))
+    X = sp.csr_matrix((weights, (row, col)), shape=shape, dtype=np.float32)
+    X.sum_duplicates()
+
+    activity = np.diff(X.indptr)
+    X = sp.diags((1.0 / np.log2(1.0 + np.maximum(activity, 1))).astype(np.float32)) @ X
+
+    support = np.bincount(X.indices, minlength=X.shape[1])
+    keep = np.flatnonzero(support >= min_support)
+    X = X[:, keep].tocsr()
+    video_ids = video_ids[keep]
+
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    X = (X @ sp.diags((1.0 / norms).astype(np.float32))).tocsr()
+    return X, video_ids
+
+
+def iter_neighbours(X, top_n: int = TOP_N, block_size: int = BLOCK_SIZE):
+    """Produit, bloc par bloc, des listes [(colonne, voisins, scores)].
+
+    Pour chaque bloc : S = X[:, bloc]^T X (creuse), suppression de la
+    diagonale et des scores negligeables, tri par (ligne, -score) puis rang
+    dans la ligne : le top-N est extrait sans boucle Python sur les paires.
+    """
+    XT = X.T.tocsr()
+    n_videos = X.shape[1]
+    for start in range(0, n_videos, block_size):
+        stop = min(start + block_size, n_videos)
+        S = (XT[start:stop] @ X).tocoo()
+        keep = (S.col != S.row + start) & (S.data >= MIN_SCORE)
+        rows, cols, vals = S.row[keep], S.col[keep], S.data[keep]
+
+        # Cle unique ligne + (1 - score) / 2 : un argsort au lieu d'un lexsort
+        key = rows.astype(np.float64) + (1.0 - np.clip(vals, 0.0, 1.0)) * 0.5
+        order = np.argsort(key)
+        rows, cols, vals = rows[order], cols[order], vals[order]
+        counts = np.bincount(rows, minlength=stop - start)
+        first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        top = (np.arange(len(rows)) - first[rows]) < top_n
+        cols, vals = cols[top], vals[top]
+
+        bounds = np.cumsum(np.minimum(counts, top_n))[:-1]
+        yield [
+            (start + i, c, v)
+            for i, (c, v) in enumerate(zip(np.split(cols, bounds), np.split(vals, bounds)))
+            if len(c)
+        ]
+
+
+def write_block(video_ids, block, now: datetime) -> int:
+    """Remplace les recommandations des videos du bloc (une transaction par bloc)."""
+    from models import VideoRecommendation
+    rows = [
+        {
+            "video_id": int(video_ids[i]),
+            "recommended_ids": ",".join(str(x) for x in video_ids[cols].tolist()),
+            "scores": ",".join(f"{s:.4f}" for s in vals.tolist()),
+            "updated_at": now,
+        }
+        for i, cols, vals in block
+    ]
+    if not rows:
+        return 0
+    VideoRecommendation.query.filter(
+        VideoRecommendation.video_id.in_([r["video_id"] for r in rows])
+    ).delete(synchronize_session=False)
+    db.session.execute(VideoRecommendation.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def build_recommendations(top_n: int = TOP_N, block_size: int = BLOCK_SIZE) -> dict:
+    from models import VideoRecommendation
+    started = time.time()
+    now = datetime.utcnow()
+
+    users, videos, weights = load_interactions()
+    X, video_ids = build_matrix(users, videos, weights)
+    loaded = time.time()
+
+    written = 0
+    for block in iter_neighbours(X, top_n, block_size):
+        written += write_block(video_ids, block, now)
+
+    # Videos sans voisins cette fois-ci : on retire leur ancienne liste
+    stale = VideoRecommendation.query.filter(VideoRecommendation.updated_at < now).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+    return {
+        "interactions": len(users),
+        "users": X.shape[0],
+        "videos": X.shape[1],
+        "written": written,
+        "stale": stale,
+        "load_seconds": round(loaded - started, 2),
+        "seconds": round(time.time() - started, 2),
+    }
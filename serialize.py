@@ -0,0 +1,105 @@
+# serialize.py
+"""Serialisation rapide des reponses de l'API.
+
+- Les URL media/HLS sont construites par concatenation sur un gabarit
+  precalcule (un seul url_for par route et par script_root), au lieu d'un
+  url_for par ligne.
+- Les lignes sont des VideoCard (colonnes seules, cf. models.load_cards).
+- Encodeur orjson s'il est installe, sinon json de la bibliotheque
+  standard en mode compact.
+- ndjson_response() diffuse une ligne JSON par element, pour les exports
+  volumineux, sans construire la liste complete en memoire.
+"""
+import json
+from datetime import date, datetime
+from urllib.parse import quote
+
+from flask import Response, request, stream_with_context, url_for
+
+try:
+    import orjson
+except ImportError:           # optionnel : repli sur json
+    orjson = None
+
+EXPORT_BATCH = 1000           # lignes lues par aller-retour SQL pendant un export
+PLACEHOLDER = "__mitabo_file__"
+URL_SAFE = "!$&'()*+,/:;=@"   # caracteres laisses tels quels par le convertisseur <path:>
+
+_templates = {}               # (endpoint, script_root) -> (prefixe, suffixe)
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Type non serialisable: {type(value).__name__}")
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=_default).encode("utf-8")
+
+
+def json_response(payload, status: int = 200) -> Response:
+    return Response(dumps(payload), status=status, mimetype="application/json")
+
+
+def ndjson_response(rows, filename: str = None) -> Response:
+    """Reponse diffusee : une ligne JSON par element de `rows` (iterable paresseux)."""
+    def generate():
+        for row in rows:
+            yield dumps(row) + b"\n"
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    if filename:
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def file_url(endpoint: str, filename: str) -> str:
+    """Equivalent de url_for(endpoint, filename=...) sans repasser par le routeur."""
+    key = (endpoint, request.script_root)
+    template = _templates.get(key)
+    if template is None:
+        prefix, _, suffix = url_for(endpoint, filename=PLACEHOLDER).partition(PLACEHOLDER)
+        template = _templates[key] = (prefix, suffix)
+    return template[0] + quote(filename, safe=URL_SAFE) + template[1]
+
+
+def source_url(card) -> str:
+    """Meme priorite que models.resolve_source_url."""
+    if card.hls_url:
+        return card.hls_url
+    if card.external_url:
+        return card.external_url
+    if card.hls_manifest:
+        return file_url("hls", card.hls_manifest)
+    if card.filename:
+        return file_url("media", card.filename)
+    return ""
+
+
+VIDEO_FIELDS = (
+    "id", "title", "creator", "category", "views", "unique_viewers",
+    "thumb_url", "source_url", "hls", "created_at",
+)
+
+
+def video_row(card) -> list:
+    """Valeurs dans l'ordre de VIDEO_FIELDS (format compact des lots)."""
+    return [
+        card.id,
+        card.title,
+        card.creator,
+        card.category,
+        card.views,
+        card.unique_viewers or 0,
+        card.thumb_url,
+        source_url(card),
+        bool(card.hls_url or card.hls_manifest),
+        card.created_at.isoformat() if card.created_at else None,
+    ]
+
+
+def video_json(card) -> dict:
+    return dict(zip(VIDEO_FIELDS, video_row(card)))
@@ -0,0 +1,280 @@
+# shared_cache.py
+"""Cache partage entre les workers gunicorn, dans un fichier mappe en memoire.
+
+Un seul fichier (par defaut dans /dev/shm) est mappe par tous les workers
+de la machine : un fragment rendu par un worker sert a tous les autres, et
+ajouter des workers ne dilue plus le taux de succes. Il contient des
+fragments HTML rendus (octets) et des compteurs entiers partages.
+
+Disposition fixe : un en-tete de HEADER_SIZE octets, puis SLOTS cases de
+SLOT_SIZE octets, groupees par paquets de WAYS cases (associativite). Une
+cle ne peut vivre que dans le paquet designe par son hash. Case :
+
+    seq u32 | longueur u32 | longueur cle u16 | type u16 | hash u64 | expiration f64 | cle | valeur
+
+Lecture sans verrou (seqlock) : l'ecrivain rend `seq` impair pendant
+l'ecriture puis pair ; le lecteur copie la case et ne garde la copie que si
+`seq` est pair et inchange. Ecriture : verrou de thread + verrou fcntl sur
+les seuls octets du paquet, donc deux workers n'ecrivent jamais la meme
+case et ne se bloquent que sur le meme paquet.
+
+Taille de case : la grille d'accueil (40 cartes avec srcset) pese ~70 Kio
+une fois rendue, d'ou des cases de 256 Kio ; 128 cases = 32 Mio de memoire
+partagee, reservee a la creation (posix_fallocate) pour qu'un /dev/shm trop
+petit desactive le cache au lieu de faire planter un worker (SIGBUS).
+
+Sans fcntl (Windows) ou si le fichier ne peut pas etre cree, le cache est
+desactive : get() renvoie None et set() ne fait rien.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:           # Windows : pas de cache partage
+    fcntl = None
+
+MAGIC = b"MTBC"
+LAYOUT_VERSION = 1
+HEADER = struct.Struct("<4sIII")          # magic, version, cases, taille de case
+HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct("<IIHHQd4x")  # seq, longueur, longueur cle, type, hash, expiration
+COUNTER = struct.Struct("<q")
+
+EMPTY, BYTES, INT = 0, 1, 2
+WAYS = 4
+READ_RETRIES = 3
+NEVER = float("inf")
+
+SLOTS = int(os.getenv("SHARED_CACHE_SLOTS", "128"))
+SLOT_SIZE = int(os.getenv("SHARED_CACHE_SLOT_SIZE", str(256 * 1024)))
+PATH = os.getenv("SHARED_CACHE_PATH") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "mitabo-shared-cache"
+)
+
+
+def key_hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+class SharedCache:
+    def __init__(self, path: str = PATH, slots: int = SLOTS, slot_size: int = SLOT_SIZE):
+        self.path = path
+        self.slots = max(slots - slots % WAYS, WAYS)
+        self.slot_size = slot_size
+        self.buckets = self.slots // WAYS
+        self.max_value = slot_size - SLOT_HEADER.size
+        self._map = None
+        self._fd = None
+        self._lock = threading.Lock()
+        if fcntl is None:
+            print("⚠ Cache partage desactive (fcntl indisponible)")
+            return
+        try:
+            self._open()
+        except OSError as e:
+            print(f"⚠ Cache partage desactive: {e}")
+
+    @property
+    def enabled(self) -> bool:
+        return self._map is not None
+
+    def _open(self):
+        size = HEADER_SIZE + self.slots * self.slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Le premier worker initialise le fichier, les autres l'attendent
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            expected = HEADER.pack(MAGIC, LAYOUT_VERSION, self.slots, self.slot_size)
+            if os.fstat(fd).st_size != size or os.pread(fd, HEADER.size, 0) != expected:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, size)
+                os.pwrite(fd, expected, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(fd, size)
+        except OSError:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    # -- disposition --------------------------------------------------------
+    def _bucket(self, hashed: int) -> int:
+        return HEADER_SIZE + (hashed % self.buckets) * WAYS * self.slot_size
+
+    def _read_slot(self, offset: int):
+        """Copie coherente d'une case : (type, hash, expiration, cle, valeur) ou None."""
+        buf = self._map
+        for _ in range(READ_RETRIES):
+            seq, length, key_len, kind, hashed, expires = SLOT_HEADER.unpack_from(buf, offset)
+            if seq & 1:
+                continue
+            if kind == EMPTY or key_len + length > self.max_value:
+                return None
+            start = offset + SLOT_HEADER.size
+            data = buf[start:start + key_len + length]
+            if SLOT_HEADER.unpack_from(buf, offset)[0] == seq:
+                return kind, hashed, expires, data[:key_len], data[key_len:]
+        return None
+
+    def _find(self, key: bytes, hashed: int):
+        base = self._bucket(hashed)
+        for way in range(WAYS):
+            slot = self._read_slot(base + way * self.slot_size)
+            if slot is not None and slot[1] == hashed and slot[3] == key:
+                return slot
+        return None
+
+    def _write_slot(self, offset: int, key: bytes, hashed: int, kind: int, value: bytes, expires: float):
+        buf = self._map
+        seq = SLOT_HEADER.unpack_from(buf, offset)[0]
+        # Impair pendant l'ecriture (meme si un worker est mort en pleine ecriture)
+        writing = (seq + 1 + (seq & 1)) & 0xFFFFFFFF
+        struct.pack_into("<I", buf, offset, writing)
+        start = offset + SLOT_HEADER.size
+        buf[start:start + len(key) + len(value)] = key + value
+        SLOT_HEADER.pack_into(buf, offset, writing, len(value), len(key), kind, hashed, expires)
+        struct.pack_into("<I", buf, offset, (writing + 1) & 0xFFFFFFFF)
+
+    def _locked(self, hashed: int):
+        return _BucketLock(self, self._bucket(hashed))
+
+    def _target(self, key: bytes, hashed: int, now: float) -> int:
+        """Case ou ecrire : meme cle, sinon vide ou expiree, sinon la plus proche de l'expiration."""
+        base = self._bucket(hashed)
+        victim, victim_expires = base, NEVER
+        for way in range(WAYS):
+            offset = base + way * self.slot_size
+            _, _, key_len, kind, slot_hash, expires = SLOT_HEADER.unpack_from(self._map, offset)
+            if kind != EMPTY and slot_hash == hashed:
+                start = offset + SLOT_HEADER.size
+                if self._map[start:start + key_len] == key:
+                    return offset
+            if kind == EMPTY or expires <= now:
+                expires = -1.0
+            if expires < victim_expires:
+                victim, victim_expires = offset, expires
+        return victim
+
+    # -- API ----------------------------------------------------------------
+    def get_entry(self, key: str):
+        """(valeur, expiration) meme perimee, ou None ; sans verrou."""
+        if self._map is None:
+            return None
+        raw = key.encode("utf-8")
+        slot = self._find(raw, key_hash(raw))
+        if slot is None or slot[0] != BYTES:
+            return None
+        return slot[4], slot[2]
+
+    def get(self, key: str):
+        entry = self.get_entry(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: float) -> bool:
+        """False si le cache est desactive ou la valeur trop grande pour une case."""
+        if self._map is None:
+            return False
+        raw = key.encode("utf-8")
+        if len(raw) + len(value) > self.max_value:
+            return False
+        hashed = key_hash(raw)
+        with self._locked(hashed):
+            now = time.time()
+            self._write_slot(self._target(raw, hashed, now), raw, hashed, BYTES, value, now + ttl)
+        return True
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Ecrit seulement si la cle est absente ou expiree (bail entre workers)."""
+        if self._map is None:
+            return False
+        raw = key.encode("utf-8")
+        if len(raw) + len(value) > self.max_value:
+            return False
+        hashed = key_hash(raw)
+        with self._locked(hashed):
+            now = time.time()
+            offset = self._target(raw, hashed, now)
+            slot = self._read_slot(offset)
+            if slot is not None and slot[3] == raw and slot[2] > now:
+                return False
+            self._write_slot(offset, raw, hashed, BYTES, value, now + ttl)
+        return True
+
+    def delete(self, key: str, value: bytes = None):
+        """Supprime la cle ; avec `value`, seulement si elle a encore cette valeur."""
+        if self._map is None:
+            return
+        raw = key.encode("utf-8")
+        hashed = key_hash(raw)
+        with self._locked(hashed):
+            offset = self._target(raw, hashed, time.time())
+            slot = self._read_slot(offset)
+            if slot is not None and slot[3] == raw and (value is None or slot[4] == value):
+                self._write_slot(offset, b"", 0, EMPTY, b"", 0.0)
+
+    def incr(self, key: str, delta: int = 1) -> int:
+        """Compteur partage par tous les workers (sans expiration)."""
+        if self._map is None:
+            return 0
+        raw = key.encode("utf-8")
+        hashed = key_hash(raw)
+        with self._locked(hashed):
+            offset = self._target(raw, hashed, time.time())
+            slot = self._read_slot(offset)
+            current = 0
+            if slot is not None and slot[0] == INT and slot[3] == raw:
+                current = COUNTER.unpack(slot[4])[0]
+            value = current + delta
+            self._write_slot(offset, raw, hashed, INT, COUNTER.pack(value), NEVER)
+        return value
+
+    def counter(self, key: str) -> int:
+        if self._map is None:
+            return 0
+        raw = key.encode("utf-8")
+        slot = self._find(raw, key_hash(raw))
+        return COUNTER.unpack(slot[4])[0] if slot is not None and slot[0] == INT else 0
+
+    def stats(self) -> dict:
+        used = 0
+        if self._map is not None:
+            now = time.time()
+            for i in range(self.slots):
+                _, _, _, kind, _, expires = SLOT_HEADER.unpack_from(self._map, HEADER_SIZE + i * self.slot_size)
+                used += kind != EMPTY and expires > now
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+            "used_slots": used,
+        }
+
+
+class _BucketLock:
+    """Verrou d'ecriture d'un paquet : thread (dans le worker) puis fcntl (entre workers)."""
+
+    def __init__(self, cache: SharedCache, offset: int):
+        self.cache = cache
+        self.offset = offset
+        self.length = WAYS * cache.slot_size
+
+    def __enter__(self):
+        self.cache._lock.acquire()
+        fcntl.lockf(self.cache._fd, fcntl.LOCK_EX, self.length, self.offset)
+
+    def __exit__(self, *exc):
+        fcntl.lockf(self.cache._fd, fcntl.LOCK_UN, self.length, self.offset)
+        self.cache._lock.release()
+
+
+shared_cache = SharedCache()
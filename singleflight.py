@@ -0,0 +1,141 @@
+# singleflight.py
+"""Coalescence des recalculs (single-flight) avec stale-while-revalidate.
+
+Quand un fragment mis en cache expire sur une page chargee, une seule
+requete le recalcule : elle prend le verrou de la cle, d'abord entre les
+threads du worker (threading.Lock), puis entre les workers (bail pose par
+shared_cache.add, qui expire seul si le worker meurt). Les autres requetes :
+
+- servent la version perimee tant qu'elle a moins de STALE secondes de
+  retard (stale-while-revalidate) ;
+- sans version perimee (cache froid), attendent au plus WAIT secondes que
+  le premier ait fini, puis calculent elles-memes en dernier recours.
+
+Les valeurs sont stockees dans le cache partage avec leur date de
+fraicheur en tete : expiration physique = fraicheur + STALE. Un fragment
+trop gros pour une case est signale par une cle `uncacheable:` pendant
+UNCACHEABLE_TTL secondes : chaque requete le rend alors directement, sans
+attendre un leader dont le resultat ne sera jamais partage.
+"""
+import os
+import struct
+import threading
+import time
+
+from shared_cache import shared_cache
+
+FRAGMENT_TTL = float(os.getenv("FRAGMENT_TTL", "30"))     # secondes
+STALE = float(os.getenv("FRAGMENT_STALE", "300"))         # retard maximal servi
+WAIT = 0.5                    # attente maximale d'un suiveur sans valeur perimee
+POLL = 0.02
+LEASE_TTL = 10                # duree de vie d'un bail (leader mort ou bloque)
+UNCACHEABLE_TTL = 60
+# Compteurs propres au worker (en memoire) : un incr() partage prendrait le
+# verrou fcntl du cache a chaque lecture
+COUNTERS = ("hits", "stale", "waits", "misses", "uncacheable")
+
+FRESH_UNTIL = struct.Struct("<d")
+
+
+def _owner() -> bytes:
+    # Lu a chaque bail : avec --preload, les workers forkes partagent les imports
+    return str(os.getpid()).encode()
+
+
+class SingleFlight:
+    def __init__(self, cache=shared_cache):
+        self.cache = cache
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self.counts = dict.fromkeys(COUNTERS, 0)
+
+    def _thread_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _lead(self, key: str):
+        """Verrou de thread puis bail entre workers ; None si un autre recalcule deja."""
+        lock = self._thread_lock(key)
+        if not lock.acquire(blocking=False):
+            return None
+        if not self.cache.add(f"lease:{key}", _owner(), LEASE_TTL):
+            lock.release()
+            return None
+        return lock
+
+    def _release(self, key: str, lock: threading.Lock):
+        self.cache.delete(f"lease:{key}", _owner())
+        # Le bail partage protege encore la cle : on peut oublier le verrou local
+        with self._locks_guard:
+            self._locks.pop(key, None)
+        lock.release()
+
+    def _read(self, key: str):
+        """(valeur, fraiche ?) ou None"""
+        entry = self.cache.get_entry(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        raw = entry[0]
+        fresh_until = FRESH_UNTIL.unpack_from(raw)[0]
+        return raw[FRESH_UNTIL.size:], fresh_until > time.time()
+
+    def _compute(self, key: str, ttl: float, render) -> str:
+        html = render()
+        value = FRESH_UNTIL.pack(time.time() + ttl) + html.encode("utf-8")
+        if not self.cache.set(key, value, ttl + STALE):
+            self.cache.set(f"uncacheable:{key}", b"", UNCACHEABLE_TTL)
+            self.counts["uncacheable"] += 1
+        return html
+
+    def fragment(self, key: str, render, ttl: float = FRAGMENT_TTL) -> str:
+        """Fragment HTML partage entre workers, recalcule par une seule requete a la fois."""
+        if not self.cache.enabled:
+            return render()
+
+        found = self._read(key)
+        if found is not None and found[1]:
+            self.counts["hits"] += 1
+            return found[0].decode("utf-8")
+
+        if found is None and self.cache.get(f"uncacheable:{key}") is not None:
+            return render()
+
+        lock = self._lead(key)
+        if lock is not None:
+            try:
+                self.counts["misses"] += 1
+                return self._compute(key, ttl, render)
+            finally:
+                self._release(key, lock)
+
+        if found is not None:
+            self.counts["stale"] += 1
+            return found[0].decode("utf-8")
+
+        # Cache froid et recalcul en cours ailleurs : courte attente
+        deadline = time.monotonic() + WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL)
+            found = self._read(key)
+            if found is not None:
+                self.counts["waits"] += 1
+                return found[0].decode("utf-8")
+        self.counts["misses"] += 1
+        return self._compute(key, ttl, render)
+
+    def invalidate(self, key: str):
+        self.cache.delete(key)
+
+    def stats(self) -> dict:
+        """Compteurs de ce worker."""
+        counts = dict(self.counts)
+        served = sum(counts[name] for name in ("hits", "stale", "waits", "misses"))
+        counts["hit_rate"] = round((served - counts["misses"]) / served, 4) if served else None
+        counts["pid"] = os.getpid()
+        return counts
+
+
+singleflight = SingleFlight()
@@ -0,0 +1,83 @@
+# storage.py
+"""Couche de stockage : centralise les acces au bucket Supabase."""
+import mimetypes
+
+from supabase_config import supabase, BUCKET_NAME
+
+
+_bucket_proxy = None
+
+
+def _bucket():
+    """Proxy du bucket, cree une fois par processus : le client HTTP (et ses
+    connexions keep-alive) est partage entre les threads."""
+    global _bucket_proxy
+    if not supabase:
+        raise RuntimeError("Supabase non configure")
+    if _bucket_proxy is None:
+        _bucket_proxy = supabase.storage.from_(BUCKET_NAME)
+    return _bucket_proxy
+
+
+def guess_content_type(key: str, default: str = "application/octet-stream") -> str:
+    return mimetypes.guess_type(key)[0] or default
+
+
+def _options(key: str, content_type: str, upsert: bool) -> dict:
+    return {
+        "content-type": content_type or guess_content_type(key),
+        "upsert": "true" if upsert else "false",
+    }
+
+
+def upload_bytes(key: str, data: bytes, content_type: str = None, upsert: bool = False) -> str:
+    """Envoie des octets vers le bucket et retourne l'URL publique."""
+    _bucket().upload(key, data, _options(key, content_type, upsert))
+    return public_url(key)
+
+
+def upload_file(key: str, local_path: str, content_type: str = None, upsert: bool = False) -> str:
+    """Envoie un fichier local vers le bucket et retourne l'URL publique."""
+    with open(local_path, "rb") as fh:
+        _bucket().upload(key, fh, _options(local_path, content_type, upsert))
+    return public_url(key)
+
+
+def public_url(key: str) -> str:
+    return _bucket().get_public_url(key)
+
+
+LIST_PAGE_SIZE = 1000
+
+
+def iter_objects(prefix: str = "", page_size: int = LIST_PAGE_SIZE):
+    """Parcourt le bucket page par page (recursif) et produit les fichiers.
+
+    Chaque element est le dict renvoye par Supabase, complete par `key`.
+    Seule une page est en memoire a la fois (plus la pile des dossiers).
+    """
+    folders = [prefix.strip("/")]
+    while folders:
+        folder = folders.pop()
+        offset = 0
+        while True:
+            page = _bucket().list(folder, {
+                "limit": page_size,
+                "offset": offset,
+                "sortBy": {"column": "name", "order": "asc"},
+            })
+            for entry in page:
+                key = f"{folder}/{entry['name']}" if folder else entry["name"]
+                if entry.get("id") is None:
+                    folders.append(key)       # sous-dossier
+                else:
+                    yield dict(entry, key=key)
+            if len(page) < page_size:
+                break
+            offset += page_size
+
+
+def remove(keys) -> None:
+    """Supprime une liste de cles du bucket."""
+    if keys:
+        _bucket().remove(list(keys))
@@ -0,0 +1,108 @@
+# storyboard.py
+"""Storyboard de previsualisation : planches de vignettes (sprites) et index
+WebVTT, pour afficher un apercu au survol de la barre de lecture sans
+telecharger de segments video."""
+import io
+import subprocess
+
+from PIL import Image
+
+import storage
+
+TILE_WIDTH = 160
+TILE_HEIGHT = 90
+INTERVAL = 5          # secondes entre deux vignettes
+COLUMNS = 10
+ROWS = 10
+SPRITE_FORMAT = "JPEG"
+SPRITE_QUALITY = 70
+
+
+def _timestamp(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3_600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def iter_frames(input_path: str, interval: int = INTERVAL):
+    """Decode la video en une seule passe ffmpeg et produit une image
+    TILE_WIDTH x TILE_HEIGHT toutes les `interval` secondes."""
+    vf = (
+        f"fps=1/{interval},"
+        f"scale={TILE_WIDTH}:{TILE_HEIGHT}:force_original_aspect_ratio=decrease,"
+        f"pad={TILE_WIDTH}:{TILE_HEIGHT}:(ow-iw)/2:(oh-ih)/2"
+    )
+    cmd = [
+        "ffmpeg", "-v", "error", "-i", input_path, "-an", "-vf", vf,
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+    ]
+    frame_size = TILE_WIDTH * TILE_HEIGHT * 3
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            raw = proc.stdout.read(frame_size)
+            if len(raw) < frame_size:
+                break
+            yield Image.frombytes("RGB", (TILE_WIDTH, TILE_HEIGHT), raw)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+def build_sprites(frames, columns: int = COLUMNS, rows: int = ROWS):
+    """Assemble les vignettes en planches de `columns` x `rows`.
+
+    Produit des tuples (planche, [(index_global, x, y), ...]).
+    """
+    per_sheet = columns * rows
+    sheet, tiles = None, []
+    for index, frame in enumerate(frames):
+        slot = index % per_sheet
+        if slot == 0:
+            if sheet is not None:
+                yield sheet, tiles
+            sheet = Image.new("RGB", (columns * TILE_WIDTH, rows * TILE_HEIGHT))
+            tiles = []
+        x = (slot % columns) * TILE_WIDTH
+        y = (slot // columns) * TILE_HEIGHT
+        sheet.paste(frame, (x, y))
+        tiles.append((index, x, y))
+    if sheet is not None:
+        # Derniere planche : on retire les lignes vides
+        used_rows = (len(tiles) + columns - 1) // columns
+        yield sheet.crop((0, 0, columns * TILE_WIDTH, used_rows * TILE_HEIGHT)), tiles
+
+
+def build_vtt(sheets, interval: int = INTERVAL) -> str:
+    """`sheets` : liste de (nom_planche, tiles) telle que produite par build_sprites."""
+    lines = ["WEBVTT", ""]
+    for name, tiles in sheets:
+        for index, x, y in tiles:
+            start = index * interval
+            lines.append(f"{_timestamp(start)} --> {_timestamp(start + interval)}")
+            lines.append(f"{name}#xywh={x},{y},{TILE_WIDTH},{TILE_HEIGHT}")
+            lines.append("")
+    return "\n".join(lines)
+
+
+def generate_storyboard(input_path: str, key_prefix: str, interval: int = INTERVAL,
+                        upsert: bool = False) -> str:
+    """Genere, stocke les planches et l'index WebVTT ; retourne l'URL du .vtt.
+    `upsert` : remplacer un storyboard deja envoye (reprise d'un import)."""
+    ext = "jpg" if SPRITE_FORMAT == "JPEG" else SPRITE_FORMAT.lower()
+    index = []
+    for n, (sheet, tiles) in enumerate(build_sprites(iter_frames(input_path, interval))):
+        buf = io.BytesIO()
+        sheet.save(buf, format=SPRITE_FORMAT, quality=SPRITE_QUALITY)
+        name = f"sprite_{n:03d}.{ext}"
+        storage.upload_bytes(f"{key_prefix}/{name}", buf.getvalue(), upsert=upsert)
+        # Chemins relatifs : resolus par rapport a l'URL du .vtt
+        index.append((name, tiles))
+
+    if not index:
+        raise RuntimeError(f"Aucune image extraite de {input_path}")
+
+    vtt = build_vtt(index, interval)
+    return storage.upload_bytes(f"{key_prefix}/storyboard.vtt", vtt.encode("utf-8"), "text/vtt", upsert=upsert)
@@ -0,0 +1,143 @@
+# suggestions.py
+"""Suggestions precalculees par video (barre laterale de la page watch).
+
+La liste classee de chaque video est stockee dans video_suggestions ; la
+page watch ne fait qu'une lecture par cle primaire puis un multi-get des
+videos. Les listes sont recalculees hors requete : a l'upload, quand
+l'engagement d'une video change, et par balayage des listes les plus
+anciennes.
+"""
+import math
+import threading
+from datetime import datetime
+
+from extensions import db
+from trending import trending
+
+SUGGESTIONS_SIZE = 12
+CANDIDATES_PER_SOURCE = 50
+SWEEP_INTERVAL = 60           # secondes
+SWEEP_BATCH = 50              # listes recalculees par balayage
+DIRTY_INTERVAL = 5
+RECENCY_DAYS = 30.0
+SAME_CREATOR_BOOST = 1.5
+COLIKE_BOOST = 2.0
+
+
+def parse_ids(raw: str):
+    return [int(x) for x in raw.split(",") if x] if raw else []
+
+
+class SuggestionStore:
+    def __init__(self):
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def mark_dirty(self, *video_ids):
+        """Demande le recalcul des listes de ces videos (sans SQL)."""
+        with self._lock:
+            self._dirty.update(video_ids)
+
+    def get(self, video_id: int):
+        """Ids suggeres pour `video_id`, ou None si la liste n'existe pas encore."""
+        from models import VideoSuggestion
+        row = db.session.get(VideoSuggestion, video_id)
+        return parse_ids(row.suggested_ids) if row else None
+
+    def rank(self, video) -> list:
+        """Classe les candidats : co-likes, meme createur, tendance de la categorie, fraicheur."""
+        from models import Video, VideoRecommendation
+        cols = (Video.id, Video.user_id, Video.created_at)
+        candidates = {}
+        for row in (
+            Video.query.with_entities(*cols)
+            .filter(Video.category == video.category, Video.id != video.id)
+            .order_by(Video.created_at.desc()).limit(CANDIDATES_PER_SOURCE)
+        ):
+            candidates[row.id] = row
+        if video.user_id:
+            for row in (
+                Video.query.with_entities(*cols)
+                .filter(Video.user_id == video.user_id, Video.id != video.id)
+                .order_by(Video.created_at.desc()).limit(CANDIDATES_PER_SOURCE // 5)
+            ):
+                candidates[row.id] = row
+
+        hot = [vid for vid in trending.top(video.category, CANDIDATES_PER_SOURCE) if vid != video.id]
+        # Voisins par co-likes, calcules hors ligne (recommendations.py)
+        reco = db.session.get(VideoRecommendation, video.id)
+        colikes = parse_ids(reco.recommended_ids) if reco else []
+        missing = [vid for vid in hot + colikes if vid not in candidates]
+        if missing:
+            for row in Video.query.with_entities(*cols).filter(Video.id.in_(missing)):
+                candidates[row.id] = row
+        hot_rank = {vid: i for i, vid in enumerate(hot)}
+        colike_rank = {vid: i for i, vid in enumerate(colikes)}
+
+        now = datetime.utcnow()
+
+        def score(row):
+            s = 0.0
+            if row.id in hot_rank:
+                s += 1.0 - hot_rank[row.id] / len(hot)
+            if row.id in colike_rank:
+                s += COLIKE_BOOST * (1.0 - colike_rank[row.id] / len(colikes))
+            if row.created_at:
+                s += math.exp(-(now - row.created_at).total_seconds() / 86400 / RECENCY_DAYS)
+            if video.user_id and row.user_id == video.user_id:
+                s += SAME_CREATOR_BOOST
+            return s
+
+        ranked = sorted(candidates.values(), key=score, reverse=True)
+        return [row.id for row in ranked[:SUGGESTIONS_SIZE]]
+
+    def rebuild(self, video_id: int):
+        from models import Video, VideoSuggestion
+        video = db.session.get(Video, video_id)
+        if video is None:
+            return
+        ids = ",".join(str(i) for i in self.rank(video))
+        row = db.session.get(VideoSuggestion, video_id)
+        if row is None:
+            db.session.add(VideoSuggestion(video_id=video_id, suggested_ids=ids))
+        else:
+            row.suggested_ids = ids
+            row.updated_at = datetime.utcnow()
+        db.session.commit()
+
+    def refresh_neighbours(self, video_id: int):
+        """Apres un upload ou un changement d'engagement : recalcule la liste
+        de la video, puis celles de ses voisines (relation quasi symetrique)."""
+        self.rebuild(video_id)
+        self.mark_dirty(*(self.get(video_id) or []))
+
+    # -- taches de fond -------------------------------------------------
+    def rebuild_dirty(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for video_id in dirty:
+            self.rebuild(video_id)
+
+    def sweep(self):
+        """Recalcule les listes les plus anciennes, et cree celles qui manquent."""
+        from models import Video, VideoSuggestion
+        missing = (
+            Video.query.with_entities(Video.id)
+            .outerjoin(VideoSuggestion, VideoSuggestion.video_id == Video.id)
+            .filter(VideoSuggestion.video_id.is_(None))
+            .limit(SWEEP_BATCH).all()
+        )
+        stale = (
+            VideoSuggestion.query.with_entities(VideoSuggestion.video_id)
+            .order_by(VideoSuggestion.updated_at.asc())
+            .limit(max(SWEEP_BATCH - len(missing), 0)).all()
+        )
+        for (video_id,) in missing + stale:
+            self.rebuild(video_id)
+
+    def register(self, runner):
+        runner.every(DIRTY_INTERVAL, self.rebuild_dirty, "suggestions: recalcul")
+        runner.every(SWEEP_INTERVAL, self.sweep, "suggestions: balayage")
+
+
+suggestions = SuggestionStore()
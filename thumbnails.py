@@ -0,0 +1,71 @@
+# thumbnails.py
+"""Generation des miniatures : une image representative extraite par ffmpeg,
+declinee en plusieurs largeurs WebP/JPEG avec Pillow."""
+import io
+import subprocess
+
+from PIL import Image, ImageOps
+
+import storage
+
+THUMB_WIDTHS = (160, 320, 640)
+THUMB_RATIO = 16 / 9
+WEBP_QUALITY = 75
+JPEG_QUALITY = 82
+
+
+def extract_frame(input_path: str, at_seconds: float = 3.0) -> Image.Image:
+    """Extrait l'image la plus representative autour de `at_seconds`.
+
+    Le filtre `thumbnail` de ffmpeg choisit, parmi un lot d'images, celle
+    qui est la plus proche de la moyenne (evite les fondus au noir).
+    """
+    for seek in (at_seconds, 0):
+        cmd = [
+            "ffmpeg", "-v", "error", "-ss", str(seek), "-i", input_path,
+            "-vf", "thumbnail=60", "-frames:v", "1",
+            "-f", "image2pipe", "-c:v", "png", "-",
+        ]
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if proc.returncode == 0 and proc.stdout:
+            img = Image.open(io.BytesIO(proc.stdout))
+            img.load()
+            return img.convert("RGB")
+    raise RuntimeError(f"Impossible d'extraire une image de {input_path}")
+
+
+def render_sizes(img: Image.Image, widths=THUMB_WIDTHS):
+    """Retourne {largeur: (webp_bytes, jpeg_bytes)} recadre en 16:9."""
+    out = {}
+    for w in widths:
+        h = int(round(w / THUMB_RATIO))
+        resized = ImageOps.fit(img, (w, h), method=Image.LANCZOS)
+
+        webp = io.BytesIO()
+        resized.save(webp, format="WEBP", quality=WEBP_QUALITY, method=4)
+
+        jpeg = io.BytesIO()
+        resized.save(jpeg, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+        out[w] = (webp.getvalue(), jpeg.getvalue())
+    return out
+
+
+def generate_thumbnails(input_path: str, key_prefix: str, at_seconds: float = 3.0, upsert: bool = False):
+    """Genere et stocke le jeu de miniatures d'une video.
+
+    Retourne (thumb_url, thumb_srcset) : l'URL JPEG la plus large (poster,
+    repli) et le `srcset` WebP a injecter dans les templates. `upsert` :
+    remplacer des miniatures deja envoyees (reprise d'un import).
+    """
+    frame = extract_frame(input_path, at_seconds)
+    sizes = render_sizes(frame)
+
+    srcset = []
+    thumb_url = None
+    for w, (webp, jpeg) in sorted(sizes.items()):
+        webp_url = storage.upload_bytes(f"{key_prefix}/{w}.webp", webp, "image/webp", upsert=upsert)
+        thumb_url = storage.upload_bytes(f"{key_prefix}/{w}.jpg", jpeg, "image/jpeg", upsert=upsert)
+        srcset.append(f"{webp_url} {w}w")
+
+    return thumb_url, ", ".join(srcset)
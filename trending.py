@@ -0,0 +1,138 @@
+# trending.py
+"""Score de tendance a decroissance exponentielle, maintenu incrementalement.
+
+Decroissance "vers l'avant" : un evenement de poids w a l'instant t ajoute
+w * exp(LAMBDA * (t - EPOCH)) au score. Tous les scores etant multiplies par
+le meme facteur au fil du temps, leur ordre ne change jamais : inutile de
+les faire decroitre, on compare directement. Les scores sont stockes en
+logarithme (log-sum-exp) pour ne jamais deborder.
+
+Chaque worker accumule les evenements en memoire ; des taches de fond les
+ecrivent par lots, rechargent le top-K par categorie et purgent les scores
+devenus negligeables.
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+from extensions import db
+
+HALF_LIFE = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24")) * 3600
+LAMBDA = math.log(2) / HALF_LIFE
+EPOCH = datetime(2025, 1, 1).timestamp()
+
+WEIGHTS = {"view": 1.0, "like": 3.0, "xp": 5.0}
+TOP_K = 100
+ALL = "__all__"
+
+FLUSH_INTERVAL = 10         # secondes
+RANKING_INTERVAL = 60
+COMPACT_INTERVAL = 3600
+# Score effectif (ramene a maintenant) sous lequel une ligne est purgee
+COMPACT_MIN_SCORE = 0.01
+
+
+def log_weight(weight: float, ts: float) -> float:
+    return math.log(weight) + LAMBDA * (ts - EPOCH)
+
+
+def logaddexp(a: float, b: float) -> float:
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def current_score(log_score: float, now: float = None) -> float:
+    """Score ramene a l'instant `now` (pour affichage ou seuils)."""
+    now = time.time() if now is None else now
+    return math.exp(log_score - LAMBDA * (now - EPOCH))
+
+
+class TrendingEngine:
+    def __init__(self):
+        self._pending = {}                   # video_id -> (log_score, category)
+        self._pending_lock = threading.Lock()
+        self._ranking = {}                   # categorie -> [video_id, ...]
+
+    # -- ecriture -------------------------------------------------------
+    def record(self, video_id: int, category: str, event: str, ts: float = None):
+        """Enregistre un evenement (vue, like, xp) ; cout O(1), sans SQL."""
+        self.record_log(video_id, category, log_weight(WEIGHTS[event], time.time() if ts is None else ts))
+
+    def record_log(self, video_id: int, category: str, value: float):
+        with self._pending_lock:
+            previous = self._pending.get(video_id)
+            if previous is not None:
+                value = logaddexp(previous[0], value)
+            self._pending[video_id] = (value, category)
+
+    def flush(self):
+        """Fusionne les evenements en attente dans trending_scores."""
+        from models import TrendingScore
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            rows = {
+                row.video_id: row
+                for row in TrendingScore.query
+                .filter(TrendingScore.video_id.in_(list(pending)))
+                .with_for_update()
+            }
+            for video_id, (value, category) in pending.items():
+                row = rows.get(video_id)
+                if row is None:
+                    db.session.add(TrendingScore(video_id=video_id, category=category, log_score=value))
+                else:
+                    row.log_score = logaddexp(row.log_score, value)
+                    row.category = category
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erreur flush tendances: {e}")
+            # On remet les evenements en attente pour le prochain passage
+            for video_id, (value, category) in pending.items():
+                self.record_log(video_id, category, value)
+            return 0
+        return len(pending)
+
+    # -- lecture ----------------------------------------------------------
+    def refresh_ranking(self, categories):
+        from models import TrendingScore
+        ranking = {}
+        base = TrendingScore.query.with_entities(TrendingScore.video_id)
+        ranking[ALL] = [
+            vid for (vid,) in base.order_by(TrendingScore.log_score.desc()).limit(TOP_K)
+        ]
+        for category in categories:
+            ranking[category] = [
+                vid for (vid,) in base.filter(TrendingScore.category == category)
+                .order_by(TrendingScore.log_score.desc()).limit(TOP_K)
+            ]
+        self._ranking = ranking
+
+    def top(self, category: str = ALL, limit: int = 40):
+        return self._ranking.get(category, [])[:limit]
+
+    def compact(self):
+        """Supprime les scores dont la valeur actuelle est negligeable."""
+        from models import TrendingScore
+        threshold = math.log(COMPACT_MIN_SCORE) + LAMBDA * (time.time() - EPOCH)
+        deleted = TrendingScore.query.filter(TrendingScore.log_score < threshold).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        return deleted
+
+    # -- taches de fond -------------------------------------------------
+    def register(self, runner, categories):
+        categories = list(categories)
+        runner.every(FLUSH_INTERVAL, self.flush, "tendances: flush")
+        runner.every(RANKING_INTERVAL, lambda: self.refresh_ranking(categories), "tendances: classement")
+        runner.every(COMPACT_INTERVAL, self.compact, "tendances: compactage")
+
+
+trending = TrendingEngine()
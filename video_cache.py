@@ -0,0 +1,195 @@
+# video_cache.py
+"""Cache LRU par worker des lignes Video (lecture a travers le cache).
+
+Les valeurs sont des VideoSnapshot immuables : une meme instance peut etre
+servie a plusieurs requetes et threads sans copie ni session.
+
+Invalidation : toute modification ORM d'une video (hors compteurs de vues,
+voir models.COUNTER_COLUMNS) ou sa suppression ajoute une ligne au journal
+video_invalidations dans la meme transaction. L'id de cette ligne est un
+compteur de version global : apres le commit, le worker auteur purge
+immediatement son cache, et chaque worker relit le journal au-dela de la
+derniere version vue toutes les POLL_INTERVAL secondes. L'obsolescence
+entre workers est donc bornee par POLL_INTERVAL, et dans tous les cas par
+le TTL des entrees (qui borne aussi l'anciennete des compteurs de vues).
+
+VIDEO_CACHE=0 desactive le cache (lecture directe en base).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from extensions import db
+
+ENABLED = os.getenv("VIDEO_CACHE", "1") != "0"
+CAPACITY = int(os.getenv("VIDEO_CACHE_SIZE", "5000"))
+TTL = float(os.getenv("VIDEO_CACHE_TTL", "60"))            # secondes
+# Une requete par worker et par intervalle, meme sans aucune modification
+POLL_INTERVAL = float(os.getenv("VIDEO_CACHE_POLL", "15"))  # secondes
+PURGE_INTERVAL = 3600
+LOG_RETENTION = timedelta(hours=1)
+
+_SESSION_KEY = "video_cache_changed"
+
+
+class VideoCache:
+    def __init__(self, capacity: int = CAPACITY, ttl: float = TTL, enabled: bool = ENABLED):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()   # video_id -> (instantane, expiration)
+        self._lock = threading.Lock()
+        self._generation = 0            # incremente a chaque invalidation locale
+        self._version = None            # dernier id du journal lu
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # -- lecture ----------------------------------------------------------
+    def get(self, video_id: int):
+        """Instantane de la video, ou None si elle n'existe pas."""
+        found = self.get_many([video_id])
+        return found[0] if found else None
+
+    def get_many(self, ids) -> list:
+        """Multi-get dans l'ordre de `ids` ; une seule requete IN pour les absents."""
+        from models import load_snapshots
+        if not ids:
+            return []
+        if not self.enabled:
+            by_id = load_snapshots(ids)
+            return [by_id[i] for i in ids if i in by_id]
+
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for video_id in ids:
+                entry = self._entries.get(video_id)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(video_id)
+                    found[video_id] = entry[0]
+            self.hits += len(found)
+            missing = [i for i in dict.fromkeys(ids) if i not in found]
+            self.misses += len(missing)
+            generation = self._generation
+
+        if missing:
+            loaded = load_snapshots(missing)
+            found.update(loaded)
+            self._store(loaded, generation)
+        return [found[i] for i in ids if i in found]
+
+    def _store(self, snapshots: dict, generation: int):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            # Une invalidation pendant la lecture en base : la valeur est peut-etre
+            # deja perimee, on la sert sans la garder
+            if generation != self._generation:
+                return
+            for video_id, snapshot in snapshots.items():
+                self._entries[video_id] = (snapshot, expires)
+                self._entries.move_to_end(video_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # -- invalidation -------------------------------------------------------
+    def invalidate(self, ids):
+        with self._lock:
+            self._generation += 1
+            for video_id in ids:
+                if self._entries.pop(video_id, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def poll(self) -> int:
+        """Applique les invalidations des autres workers depuis la derniere version lue."""
+        from models import VideoInvalidation
+        if self._version is None:
+            self._version = db.session.query(db.func.max(VideoInvalidation.id)).scalar() or 0
+            return 0
+        rows = (
+            db.session.query(VideoInvalidation.id, VideoInvalidation.video_id)
+            .filter(VideoInvalidation.id > self._version)
+            .order_by(VideoInvalidation.id)
+            .all()
+        )
+        if rows:
+            self._version = rows[-1][0]
+            self.invalidate({video_id for _, video_id in rows})
+        return len(rows)
+
+    def purge(self) -> int:
+        from models import VideoInvalidation
+        limit = datetime.utcnow() - LOG_RETENTION
+        deleted = VideoInvalidation.query.filter(
+            VideoInvalidation.created_at < limit
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    # -- suivi des ecritures ORM ------------------------------------------
+    def _after_flush(self, session, flush_context):
+        from models import COUNTER_COLUMNS, SNAPSHOT_COLUMNS, Video, VideoInvalidation
+        watched = [name for name in SNAPSHOT_COLUMNS if name not in COUNTER_COLUMNS]
+        changed = {obj.id for obj in session.deleted if isinstance(obj, Video)}
+        for obj in session.dirty:
+            if isinstance(obj, Video):
+                attrs = inspect(obj).attrs
+                if any(attrs[name].history.has_changes() for name in watched):
+                    changed.add(obj.id)
+        changed.discard(None)
+        if not changed:
+            return
+        now = datetime.utcnow()
+        session.connection().execute(
+            VideoInvalidation.__table__.insert(),
+            [{"video_id": video_id, "created_at": now} for video_id in changed],
+        )
+        session.info.setdefault(_SESSION_KEY, set()).update(changed)
+
+    def _after_commit(self, session):
+        changed = session.info.pop(_SESSION_KEY, None)
+        if changed:
+            self.invalidate(changed)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop(_SESSION_KEY, None)
+
+    def install(self):
+        event.listen(Session, "after_flush", self._after_flush)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_soft_rollback", self._after_rollback)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "version": self._version,
+        }
+
+    def register(self, runner):
+        runner.every(POLL_INTERVAL, self.poll, "cache videos: invalidations")
+        runner.every(PURGE_INTERVAL, self.purge, "cache videos: purge du journal")
+
+
+video_cache = VideoCache()
+video_cache.install()